@@ -0,0 +1,310 @@
+"""
+build_schedules.py - Microbenchmark of the RTML schedule builders
+
+Times the template based schedule builders in ltrtml, with a fresh group
+cache per call as submit_group uses them, against copies of the previous
+element by element, dict based builders for each instrument (a 12 filter
+survey observation for IO:O and every filter for Moptop). The cost of
+converting the observation dict to its model is timed separately and the
+speed-up compares the legacy builder with conversion plus template build.
+No connection to the telescope is made.
+
+Run from the repository root with;
+    python benchmarks/build_schedules.py
+"""
+import os
+import sys
+import tempfile
+import timeit
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ltrtml  # noqa: E402
+
+REPEAT = 5
+NUMBER = 200
+
+settings = {
+    'username': 'bench',
+    'rtmlpass': 'bench',
+    'proposal': 'bench',
+    'prefix': 'bench',
+    'LT_HOST': 'localhost',
+    'LT_PORT': '8080',
+    'PKLFILE': os.path.join(tempfile.gettempdir(), 'ltrtml_bench'),
+    'DEBUG': False,
+}
+
+target = {
+    'name': 'Vega',
+    'RA': '18:36:56.336',
+    'DEC': '+38:47:01.280',
+}
+
+constraints = {
+    'air_mass': '2.0',
+    'sky_bright': '2.0',
+    'seeing': '1.2',
+    'photometric': 'yes',
+    'start_date': '2020-02-18',
+    'start_time': '18:00:00.00',
+    'end_date': '2020-02-28',
+    'end_time': '00:00:00.00',
+}
+
+observations = {
+    'IO:O': {'instrument': 'IO:O', 'target': target, 'binning': '2',
+             'filters': {f: {'exp_time': '60', 'exp_count': '3'} for f in ltrtml.IOO_FILTERS}},
+    'IO:I': {'instrument': 'IO:I', 'target': target, 'exp_time': '120.0', 'exp_count': '5'},
+    'Sprat': {'instrument': 'Sprat', 'target': target, 'exp_time': '120.0', 'exp_count': '3', 'grating': 'blue'},
+    'Frodo': {'instrument': 'Frodo', 'target': target,
+              'exp_time_Blue': '120.0', 'exp_count_Blue': '3', 'res_Blue': 'high',
+              'exp_time_Red': '120.0', 'exp_count_Red': '3', 'res_Red': 'high'},
+    'Moptop': {'instrument': 'Moptop', 'target': target,
+               'filters': {f: {'exp_time': '60', 'rot_speed': 'slow'} for f in ltrtml.MOPTOP_FILTERS}},
+}
+
+builders = {
+    'IO:O': '_build_inst_schedule_IOO',
+    'IO:I': '_build_inst_schedule_IOI',
+    'Sprat': '_build_inst_schedule_Sprat',
+    'Frodo': '_build_inst_schedule_Frodo',
+    'Moptop': '_build_inst_schedule_Moptop',
+}
+
+
+def legacy_build_target(target):
+    """
+    The target builder as it was before the models, splitting the RA and DEC strings each time
+    """
+    target_el = etree.Element('Target', name=target['name'])
+    coordinates = etree.SubElement(target_el, 'Coordinates')
+
+    ra_hour, ra_min, ra_sec = target['RA'].split(":")
+    dec_deg, dec_min, dec_sec = target['DEC'].split(":")
+
+    ra = etree.SubElement(coordinates, 'RightAscension')
+    etree.SubElement(ra, 'Hours').text = ra_hour
+    etree.SubElement(ra, 'Minutes').text = ra_min
+    etree.SubElement(ra, 'Seconds').text = ra_sec
+
+    dec = etree.SubElement(coordinates, 'Declination')
+    etree.SubElement(dec, 'Degrees').text = dec_deg
+    etree.SubElement(dec, 'Arcminutes').text = dec_min
+    etree.SubElement(dec, 'Arcseconds').text = dec_sec
+    etree.SubElement(coordinates, 'Equinox').text = 'None'
+    return target_el
+
+
+def legacy_build_constraints(constraints):
+    """
+    The constraints builder as it was before the models, working from the constraints dict
+    """
+    if constraints['photometric'] == 'yes':
+        photometric = 'clear'
+    elif constraints['photometric'] == 'no':
+        photometric = 'light'
+    else:
+        raise ValueError('Please chose yes or no for photometric')
+    const = etree.Element('Constraints')
+    airmass_const = etree.SubElement(const, 'AirmassConstraint', maximum=str(constraints['air_mass']))
+
+    sky_const = etree.SubElement(const, 'SkyConstraint')
+    etree.SubElement(sky_const, 'Flux').text = str(constraints['sky_bright'])
+    etree.SubElement(sky_const, 'Units').text = 'magnitudes/square-arcsecond'
+
+    seeing_const = etree.SubElement(const, 'SeeingConstraint',
+                                    maximum=(str(constraints['seeing'])),
+                                    units='arcseconds')
+
+    photom_const = etree.SubElement(const, 'ExtinctionConstraint')
+    etree.SubElement(photom_const, 'Clouds').text = photometric
+
+    date_const = etree.SubElement(const, 'DateTimeConstraint', type='include')
+    start = constraints['start_date'] + 'T' + constraints['start_time'] + '+00:00'
+    end = constraints['end_date'] + 'T' + constraints['end_time'] + '+00:00'
+    etree.SubElement(date_const, 'DateTimeStart', system='UT', value=start)
+    etree.SubElement(date_const, 'DateTimeEnd', system='UT', value=end)
+    return [airmass_const, sky_const, seeing_const, photom_const, date_const]
+
+
+def legacy_build_inst_schedule_IOI(observation, payload):
+    """
+    The IO:I builder as it was before schedule templates
+    """
+    target = observation['target']
+    constraints = observation['constraints']
+    schedule = etree.Element('Schedule')
+    device = etree.SubElement(schedule, 'Device', name="IO:I", type="camera")
+    etree.SubElement(device, 'SpectralRegion').text = 'infrared'
+    setup = etree.SubElement(device, 'Setup')
+    etree.SubElement(setup, 'Filter', type='H')
+    detector = etree.SubElement(setup, 'Detector')
+    binning = etree.SubElement(detector, 'Binning')
+    etree.SubElement(binning, 'X', units='pixels').text = '1'
+    etree.SubElement(binning, 'Y', units='pixels').text = '1'
+    exposure = etree.SubElement(schedule, 'Exposure', count=observation['exp_count'])
+    etree.SubElement(exposure, 'Value', units='seconds').text = observation['exp_time']
+    schedule.append(legacy_build_target(target))
+    for const in legacy_build_constraints(constraints):
+        schedule.append(const)
+    payload.append(schedule)
+
+
+def legacy_build_inst_schedule_Sprat(observation, payload):
+    """
+    The Sprat builder as it was before schedule templates
+    """
+    target = observation['target']
+    constraints = observation['constraints']
+    if observation['grating'] == 'red' or observation['grating'] == 'blue':
+        pass
+    else:
+        raise ValueError('Enter either "red" or "blue" in grating')
+    schedule = etree.Element('Schedule')
+    device = etree.SubElement(schedule, 'Device', name="Sprat", type="spectrograph")
+    etree.SubElement(device, 'SpectralRegion').text = 'optical'
+    setup = etree.SubElement(device, 'Setup')
+    etree.SubElement(setup, 'Grating', name=observation['grating'])
+    detector = etree.SubElement(setup, 'Detector')
+    binning = etree.SubElement(detector, 'Binning')
+    etree.SubElement(binning, 'X', units='pixels').text = '1'
+    etree.SubElement(binning, 'Y', units='pixels').text = '1'
+    exposure = etree.SubElement(schedule, 'Exposure', count=observation['exp_count'])
+    etree.SubElement(exposure, 'Value', units='seconds').text = observation['exp_time']
+    schedule.append(legacy_build_target(target))
+    for const in legacy_build_constraints(constraints):
+        schedule.append(const)
+    payload.append(schedule)
+
+
+def legacy_build_inst_schedule_IOO(observation, payload):
+    """
+    The IO:O builder as it was before schedule templates, rebuilding the filter
+    list and every element in turn from the observation and constraints dicts
+    """
+    filters = ['U',
+               'R',
+               'G',
+               'I',
+               'Z',
+               'B',
+               'V',
+               'Halpha6566',
+               'Halpha6634',
+               'Halpha6705',
+               'Halpha6755',
+               'Halpha6822']
+    target = observation['target']
+    constraints = observation['constraints']
+    for filter in observation['filters']:
+        if filter in filters:
+            schedule = etree.Element('Schedule')
+            device = etree.SubElement(schedule, 'Device', name=observation['instrument'], type='camera')
+            etree.SubElement(device, 'SpectralRegion').text = 'optical'
+            setup = etree.SubElement(device, 'Setup')
+            etree.SubElement(setup, 'Filter', type=str(filter))
+            detector = etree.SubElement(setup, 'Detector')
+            binning = etree.SubElement(detector, 'Binning')
+            etree.SubElement(binning, 'X', units='pixels').text = observation['binning']
+            etree.SubElement(binning, 'Y', units='pixels').text = observation['binning']
+            exposure = etree.SubElement(schedule, 'Exposure', count=observation['filters'][filter]['exp_count'])
+            etree.SubElement(exposure, 'Value', units='seconds').text = observation['filters'][filter]['exp_time']
+            schedule.append(legacy_build_target(target))
+            for const in legacy_build_constraints(constraints):
+                schedule.append(const)
+            payload.append(schedule)
+        else:
+            raise ValueError('Filter {0} not available for IO:O'.format(filter))
+
+
+def legacy_build_inst_schedule_Moptop(observation, payload):
+    """
+    The Moptop builder as it was before schedule templates, rebuilding the filter
+    list and every element in turn from the observation and constraints dicts
+    """
+    filters = ['B',
+               'V',
+               'R',
+               'I',
+               'L']
+    target = observation['target']
+    constraints = observation['constraints']
+    for filter in observation['filters']:
+        if filter in filters:
+            schedule = etree.Element('Schedule')
+            device = etree.SubElement(schedule, 'Device', name=observation['instrument'], type='polarimeter')
+            etree.SubElement(device, 'SpectralRegion').text = 'optical'
+            setup = etree.SubElement(device, 'Setup')
+            etree.SubElement(setup, 'Filter', type=str(filter))
+            etree.SubElement(setup, 'Device', rotorSpeed=observation['filters'][filter]['rot_speed'],
+                             type='half-wave_plate')
+            exposure = etree.SubElement(schedule, 'Exposure', count='1')
+            etree.SubElement(exposure, 'Value', units='seconds').text = observation['filters'][filter]['exp_time']
+            schedule.append(legacy_build_target(target))
+            for const in legacy_build_constraints(constraints):
+                schedule.append(const)
+            payload.append(schedule)
+        else:
+            raise ValueError('Filter {0} not available for Moptop'.format(filter))
+
+
+def legacy_build_inst_schedule_Frodo(observation, payload):
+    """
+    The Frodo builder as it was before schedule templates
+    """
+    target = observation['target']
+    constraints = observation['constraints']
+    colours = ('Blue', 'Red')
+    for colour in colours:  # builds schedule for each colour arm of Frodo
+        res = observation['res_{}'.format(colour)]
+        time = observation['exp_time_{}'.format(colour)]
+        count = observation['exp_count_{}'.format(colour)]
+
+        schedule = etree.Element('Schedule')
+        device = etree.SubElement(schedule, 'Device', name="FrodoSpec-{}".format(colour), type="spectrograph")
+        etree.SubElement(device, 'SpectralRegion').text = 'optical'
+        setup = etree.SubElement(device, 'Setup')
+        etree.SubElement(setup, 'Grating', name=res)
+        exposure = etree.SubElement(schedule, 'Exposure', count=count)
+        etree.SubElement(exposure, 'Value', units='seconds').text = time
+        schedule.append(legacy_build_target(target))
+        for const in legacy_build_constraints(constraints):
+            schedule.append(const)
+        payload.append(schedule)
+
+
+legacy_builders = {
+    'IO:O': legacy_build_inst_schedule_IOO,
+    'IO:I': legacy_build_inst_schedule_IOI,
+    'Sprat': legacy_build_inst_schedule_Sprat,
+    'Frodo': legacy_build_inst_schedule_Frodo,
+    'Moptop': legacy_build_inst_schedule_Moptop,
+}
+
+
+def best(func):
+    """
+    Returns the best time per call in microseconds
+    """
+    return min(timeit.repeat(func, repeat=REPEAT, number=NUMBER)) / NUMBER * 1e6
+
+
+def main():
+    obs = ltrtml.LTObs(settings)
+    group_constraints = ltrtml.Constraints.from_dict(constraints)
+    print('{0:<10}{1:>14}{2:>14}{3:>14}{4:>10}'.format('builder', 'template us', 'from dict us', 'legacy us', 'speed-up'))
+    for instrument, builder in builders.items():
+        observation = ltrtml.observation_from_dict(observations[instrument])
+        func = getattr(obs, builder)
+        template = best(lambda: func(observation, group_constraints, etree.Element('RTML'), {}))
+        convert = best(lambda: ltrtml.observation_from_dict(observations[instrument]))
+        legacy_observation = dict(observations[instrument], constraints=constraints)
+        legacy_func = legacy_builders[instrument]
+        legacy = best(lambda: legacy_func(legacy_observation, etree.Element('RTML')))
+        print('{0:<10}{1:>14.1f}{2:>14.1f}{3:>14.1f}{4:>9.1f}x'.format(
+            instrument, template, convert, legacy, legacy / (template + convert)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+mock_node_agent.py - Local stand-in for the LT node agent SOAP service
+
+Serves a WSDL at /node_agent2/node_agent?wsdl and answers handle_rtml calls,
+confirming or rejecting each RTML document after an optional delay. It is
+used by the benchmarks and can be pointed at by any LTObs settings with
+LT_HOST 'localhost' and the chosen LT_PORT.
+
+Run stand alone with;
+    python benchmarks/mock_node_agent.py --port 8080 --latency 0.05 --reject-rate 0.1
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+from lxml import etree
+
+WSDL = '''<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+             xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+             xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+             xmlns:tns="urn:node_agent"
+             targetNamespace="urn:node_agent">
+  <message name="handle_rtmlRequest"><part name="document" type="xsd:string"/></message>
+  <message name="handle_rtmlResponse"><part name="return" type="xsd:string"/></message>
+  <portType name="NodeAgent">
+    <operation name="handle_rtml">
+      <input message="tns:handle_rtmlRequest"/>
+      <output message="tns:handle_rtmlResponse"/>
+    </operation>
+  </portType>
+  <binding name="NodeAgentBinding" type="tns:NodeAgent">
+    <soap:binding style="rpc" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="handle_rtml">
+      <soap:operation soapAction=""/>
+      <input><soap:body use="encoded" namespace="urn:node_agent"
+                        encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"/></input>
+      <output><soap:body use="encoded" namespace="urn:node_agent"
+                         encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"/></output>
+    </operation>
+  </binding>
+  <service name="NodeAgentService">
+    <port name="node_agent" binding="tns:NodeAgentBinding">
+      <soap:address location="http://{host}/node_agent2/node_agent"/>
+    </port>
+  </service>
+</definitions>
+'''
+
+RESPONSE = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+            '<soapenv:Body><ns1:handle_rtmlResponse xmlns:ns1="urn:node_agent">'
+            '<return>{0}</return>'
+            '</ns1:handle_rtmlResponse></soapenv:Body></soapenv:Envelope>')
+
+RTML_REPLY = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+              '<RTML xmlns="http://www.rtml.org/v3.1a" mode="{mode}" uid="{uid}" version="3.1a">'
+              '{body}</RTML>')
+
+
+class NodeAgentHandler(BaseHTTPRequestHandler):
+    """
+    Handles the WSDL download and handle_rtml calls for MockNodeAgent
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body):
+        body = body.encode('UTF-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out and gave up before the reply
+
+    def do_GET(self):
+        self.server.count('wsdl')
+        self._reply(WSDL.format(host=self.headers['Host']))
+
+    def do_POST(self):
+        envelope = etree.fromstring(self.rfile.read(int(self.headers['Content-Length'])))
+        document = next(element.text for element in envelope.iter() if etree.QName(element).localname == 'document')
+        rtml = etree.fromstring(document.encode('UTF-8'))
+        mode = rtml.get('mode')
+        self.server.count(mode)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.reject_rate:
+            reply = RTML_REPLY.format(mode='reject', uid=rtml.get('uid'), body=self.server.reject_body)
+        else:
+            reply = RTML_REPLY.format(mode='confirm', uid=rtml.get('uid'), body='')
+        self._reply(RESPONSE.format(escape(reply)))
+
+
+class MockNodeAgent(ThreadingHTTPServer):
+    """
+    Threaded HTTP server acting as the node agent.
+    latency is the delay in seconds before each handle_rtml reply and
+    reject_rate the fraction of documents which are rejected
+    """
+    daemon_threads = True
+
+    def __init__(self, host='localhost', port=0, latency=0.0, reject_rate=0.0,
+                 reject_body='<Error>Rejected by mock node agent</Error>'):
+        ThreadingHTTPServer.__init__(self, (host, port), NodeAgentHandler)
+        self.latency = latency
+        self.reject_rate = reject_rate
+        self.reject_body = reject_body
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, kind):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def start(self):
+        """
+        Serves requests from a background thread and returns the server
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the LT node agent')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each reply')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='fraction of documents rejected')
+    args = parser.parse_args()
+    server = MockNodeAgent(args.host, args.port, args.latency, args.reject_rate)
+    print('Mock node agent on http://{0}:{1}/node_agent2/node_agent?wsdl'.format(args.host, server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+throughput.py - Submission and cancellation benchmark against the mock node agent
+
+Starts a local MockNodeAgent and measures groups per second and per group
+latency of submit_group/submit_groups and cancel_group/cancel_groups for
+each instrument, group size (observations per group) and concurrency level.
+One JSON object is written per line for every combination, so results can
+be compared between releases.
+
+Run from the repository root with;
+    python benchmarks/throughput.py --groups 50 --latency 0.02 --output results.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ltrtml  # noqa: E402
+from build_schedules import observations, constraints  # noqa: E402
+from mock_node_agent import MockNodeAgent  # noqa: E402
+
+
+def make_group(instrument, size):
+    """
+    Returns a group of size observations of the instrument, each with its own target
+    """
+    group = []
+    for i in range(size):
+        target = {'name': 'bench{0}'.format(i),
+                  'RA': '{0:02d}:30:00.00'.format(i % 24),
+                  'DEC': '+{0:02d}:15:00.00'.format(i % 80)}
+        group.append(dict(observations[instrument], target=target))
+    return group
+
+
+def run(server, workdir, instrument, size, concurrency, groups):
+    """
+    Submits then cancels groups of one kind and returns the result record
+    """
+    settings = {
+        'username': 'bench',
+        'rtmlpass': 'bench',
+        'proposal': 'bench',
+        'prefix': 'bench',
+        'LT_HOST': 'localhost',
+        'LT_PORT': str(server.port),
+        'PKLFILE': os.path.join(workdir, '{0}_{1}_{2}'.format(instrument.replace(':', ''), size, concurrency)),
+        'DEBUG': False,
+        'WSDL_CACHE': os.path.join(workdir, 'wsdl'),
+        'DEDUP': False,  # Every group in a run is identical, send them all
+    }
+    obs = ltrtml.LTObs(settings)
+    metrics = ltrtml.LTMetrics()
+    obs.add_hook(metrics)
+    batch = [(make_group(instrument, size), constraints)] * groups
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = [obs.submit_group(*group) for group in batch]
+    else:
+        results = obs.submit_groups(batch, max_workers=concurrency)
+    submit_wall = time.perf_counter() - start
+
+    uids = obs.get_uids()
+    start = time.perf_counter()
+    if concurrency == 1:
+        cancels = [obs.cancel_group(uid) for uid in uids]
+    else:
+        cancels = list(obs.cancel_groups(uids, max_workers=concurrency).values())
+    cancel_wall = time.perf_counter() - start
+
+    summary = metrics.summary()
+    return {
+        'instrument': instrument,
+        'group_size': size,
+        'concurrency': concurrency,
+        'groups': groups,
+        'submit_ok': sum(1 for result in results if result[0] != 'fail'),
+        'submit_wall': submit_wall,
+        'submit_groups_per_sec': groups / submit_wall,
+        'submit_build_per_group': summary['submit.build']['mean'],
+        'submit_latency': summary.get('submit.send'),
+        'cancel_ok': sum(1 for errors in cancels if errors == []),
+        'cancel_wall': cancel_wall,
+        'cancel_groups_per_sec': len(uids) / cancel_wall if uids else None,
+        'cancel_latency': summary.get('cancel.send'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ltrtml throughput benchmark against a mock node agent')
+    parser.add_argument('--groups', type=int, default=50, help='groups submitted per combination')
+    parser.add_argument('--latency', type=float, default=0.02, help='mock node agent reply delay (s)')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='fraction of groups rejected')
+    parser.add_argument('--instruments', nargs='+', default=list(observations))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 5, 20])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--output', help='append results to this JSONL file instead of stdout')
+    args = parser.parse_args()
+
+    server = MockNodeAgent(latency=args.latency, reject_rate=args.reject_rate).start()
+    workdir = tempfile.mkdtemp(prefix='ltrtml_bench_')
+    out = open(args.output, 'a') if args.output else sys.stdout
+    environment = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mock_latency': args.latency,
+        'mock_reject_rate': args.reject_rate,
+    }
+    try:
+        for instrument in args.instruments:
+            for size in args.sizes:
+                for concurrency in args.concurrency:
+                    record = run(server, workdir, instrument, size, concurrency, args.groups)
+                    record.update(environment)
+                    out.write(json.dumps(record) + '\n')
+                    out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
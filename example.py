@@ -12,7 +12,7 @@ settings = {
     'prefix': '',        # Prefix to Group UID
     'LT_HOST': '',       # IP used to connect to the LT
     'LT_PORT': '',       # Port used to connect to the LT
-    'PKLFILE': 'pickle', # Name of picklefile for storing observations
+    'PKLFILE': 'pickle', # Name of the uid store for submitted observations (saved as PKLFILE.db)
     'DEBUG': False,      # Store all RTML responses for debugging, [True, False]
 }
 
@@ -139,5 +139,6 @@ else:
 print(obs.get_uids())
 
 # Cancel all observations in the proposal that have been sent via ltrtml
-for uid in obs.get_uids():
-    obs.cancel_group(uid)
+for uid, error in obs.cancel_groups(obs.get_uids()).items():
+    if error:
+        print(error)
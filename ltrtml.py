@@ -1,28 +1,1596 @@
 import time
 import pickle
 import os
+import sys
+import json
+import io
+import gzip
+import zlib
+import queue
+import atexit
+import argparse
+import socketserver
+import hashlib
+import sqlite3
+import stat
+import tempfile
+import threading
+import copy
+import csv
+import datetime
+import random
+import http.client
+from urllib.error import URLError, HTTPError
+import itertools
+from collections import deque, namedtuple, defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
 import suds
+from suds.cache import ObjectCache
 from suds.client import Client
+from suds.transport import TransportError
 from lxml import etree
 
 
+class LTMetrics():
+    """
+    Collects the wall time and count of each phase of submit and cancel.
+    Register with LTObs.add_hook(metrics) and read back with summary()
+    """
+
+    def __init__(self, window=10000):
+        """
+        Keeps exact counts and totals, and the last window samples of
+        each phase for the percentiles
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears everything recorded so far
+        """
+        with self._lock:
+            self._counts = defaultdict(int)
+            self._totals = defaultdict(float)
+            self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def __call__(self, phase, seconds):
+        """
+        Records one timing, this is the hook signature used by LTObs
+        """
+        with self._lock:
+            self._counts[phase] += 1
+            self._totals[phase] += seconds
+            self._samples[phase].append(seconds)
+
+    def summary(self):
+        """
+        Returns a dict of phase to count, total, mean, p50, p95 and max, with times in seconds
+        """
+        with self._lock:
+            phases = {phase: sorted(samples) for phase, samples in self._samples.items()}
+            counts = dict(self._counts)
+            totals = dict(self._totals)
+        summary = {}
+        for phase, samples in phases.items():
+            summary[phase] = {
+                'count': counts[phase],
+                'total': totals[phase],
+                'mean': totals[phase] / counts[phase],
+                'p50': _percentile(samples, 50),
+                'p95': _percentile(samples, 95),
+                'max': samples[-1],
+            }
+        return summary
+
+
+def _percentile(samples, percent):
+    """
+    Nearest rank percentile of an already sorted list
+    """
+    rank = max(int(round(percent / 100 * len(samples))), 1)
+    return samples[rank - 1]
+
+
+class _PhaseTimer():
+    """
+    Times a with block and passes the phase name and wall time to each hook
+    """
+
+    def __init__(self, hooks, phase):
+        self.hooks = hooks
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        for hook in self.hooks:
+            hook(self.phase, seconds)
+
+
+_NOT_TIMED = nullcontext()
+
+
+def _timed(hooks, phase):
+    """
+    Returns a context manager timing phase, or a shared do-nothing one when no hooks are registered
+    """
+    if hooks:
+        return _PhaseTimer(hooks, phase)
+    return _NOT_TIMED
+
+
+class LTTransportError(Exception):
+    """
+    Raised when the node agent could not be reached, after any retries.
+    sent is False when the request is known not to have reached the node agent
+    and None when it may have been received but the reply was lost
+    """
+
+    def __init__(self, message, sent=None):
+        Exception.__init__(self, message)
+        self.sent = sent
+
+
+class CircuitOpenError(LTTransportError):
+    """
+    Raised without contacting the node agent while the circuit breaker is open
+    """
+
+    def __init__(self, message):
+        LTTransportError.__init__(self, message, sent=False)
+
+
+class TransportPolicy():
+    """
+    Timeout, retry and circuit breaker settings for the SOAP transport.
+    timeout is the socket timeout for each attempt and deadline (if set) the total
+    time allowed for a call including retries. Failed attempts are retried up to
+    retries times after a random delay of up to backoff * 2**attempt (capped at
+    max_backoff) seconds. After breaker_threshold failed calls in a row the breaker
+    opens and calls fail straight away for breaker_reset seconds
+    """
+
+    def __init__(self, timeout=30, deadline=None, retries=2, backoff=0.5, max_backoff=8,
+                 breaker_threshold=5, breaker_reset=30):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Builds a policy from the optional settings TIMEOUT, DEADLINE, RETRIES,
+        BACKOFF, BREAKER_THRESHOLD and BREAKER_RESET
+        """
+        policy = cls()
+        for key in ('timeout', 'deadline', 'retries', 'backoff', 'breaker_threshold', 'breaker_reset'):
+            if key.upper() in settings:
+                setattr(policy, key, settings[key.upper()])
+        return policy
+
+    def delay(self, attempt):
+        """
+        Returns the jittered wait before retry number attempt (counting from 0)
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class _CircuitBreaker():
+    """
+    Counts failed calls in a row and fails fast once there have been too many.
+    After the reset time one trial call is let through to see if the node agent is back
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.failures = 0
+        self.opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """
+        Raises CircuitOpenError if calls should not be made at the moment.
+        Returns True if the call is the trial made after breaker_reset, which
+        must end with success, failure or release
+        """
+        with self._lock:
+            if self.opened is None:
+                return False
+            if self._trial or time.monotonic() - self.opened < self.policy.breaker_reset:
+                raise CircuitOpenError('Node agent unavailable, not retrying until it recovers')
+            self._trial = True
+            return True
+
+    def release(self):
+        """
+        Ends a trial that neither succeeded nor failed, so another can be made
+        """
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened is not None or self.failures >= self.policy.breaker_threshold:
+                self.opened = time.monotonic()
+
+
+def _http_status(error):
+    """
+    Returns the HTTP status of an error reply, or None if error is not one.
+    suds raises TransportError for a failed WSDL download, but for a failed call
+    it raises a plain Exception((status, reason)) for any status but 500
+    """
+    if isinstance(error, TransportError):
+        return error.httpcode
+    if type(error) is Exception and len(error.args) == 1:
+        arg = error.args[0]
+        if isinstance(arg, tuple) and len(arg) == 2 and isinstance(arg[0], int):
+            return arg[0]
+    return None
+
+
+def _transient(error):
+    """
+    Returns (transient, sent) for an exception from the transport.
+    sent is False when the request cannot have reached the node agent
+    """
+    status = _http_status(error)
+    if status is not None:
+        # A 4xx or 503 reply means the request was refused, not processed
+        return status in (502, 503, 504), False if status == 503 or 400 <= status < 500 else None
+    if isinstance(error, URLError) and not isinstance(error, HTTPError):
+        # urllib wraps failures to connect or send the request, the reply was never read
+        return True, False
+    return isinstance(error, (OSError, http.client.HTTPException)), None
+
+
+class LTSession():
+    """
+    Long-lived SOAP session with the LT node agent.
+    The suds Client is built once and the parsed WSDL is kept in an on-disk cache
+    """
+
+    def __init__(self, settings, policy=None):
+        """
+        Sets up the connection details from the settings dict.
+        The client itself is only created on first use.
+        policy is a TransportPolicy, by default made from the settings
+        """
+        self.url = '{0}://{1}:{2}/node_agent2/node_agent?wsdl'.format('http',
+                                                                      settings['LT_HOST'], settings['LT_PORT'])
+        self.headers = {
+            'Username': settings['username'],
+            'Password': settings['rtmlpass']
+        }
+        self.cache_dir = settings.get('WSDL_CACHE', os.path.join(tempfile.gettempdir(), 'ltrtml_wsdl'))
+        self.cache_days = settings.get('WSDL_CACHE_DAYS', 1)
+        self._idle = []  # Pooled clients not in use
+        self._clients = 0
+        self._lock = threading.Lock()
+        self.hooks = []
+        self.policy = policy or TransportPolicy.from_settings(settings)
+        self.breaker = _CircuitBreaker(self.policy)
+
+    def _new_client(self):
+        """
+        Creates a suds Client, reading the parsed WSDL from the cache when it is there
+        """
+        with _timed(self.hooks, 'wsdl'):
+            cache = ObjectCache(location=self.cache_dir, days=self.cache_days)
+            return Client(url=self.url, headers=self.headers, cache=cache, cachingpolicy=1,
+                          timeout=self.policy.timeout)
+
+    def _acquire(self):
+        """
+        Takes an idle suds Client from the session's pool, creating one if all are
+        in use. The first fetches the WSDL (unless the cache already holds it) and the
+        rest load the cached copy. Clients stay in the pool for the life of the session,
+        so a warm process does not load the WSDL again however its threads come and go
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            first = self._clients == 0
+            self._clients += 1
+            if first:
+                try:
+                    return self._new_client()
+                except BaseException:
+                    self._clients -= 1
+                    raise
+        try:
+            return self._new_client()
+        except BaseException:
+            with self._lock:
+                self._clients -= 1
+            raise
+
+    def _release(self, client):
+        """
+        Returns a client taken with _acquire to the pool
+        """
+        with self._lock:
+            self._idle.append(client)
+
+    def handle_rtml(self, payload, idempotent=False, headers=None):
+        """
+        Sends an RTML string to the node agent and returns the response string.
+        Transient failures are retried following the policy, but unless the call is
+        idempotent only when the request is known not to have reached the node agent,
+        so a lost reply never leads to a second copy of a group.
+        headers replaces the session's Username and Password for this call, so one
+        session can send for several proposals on the same node agent.
+        Raises LTTransportError (or CircuitOpenError) if the call does not succeed
+        """
+        if headers is None:
+            headers = self.headers
+        policy = self.policy
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            trial = self.breaker.before()
+            timeout = policy.timeout
+            if policy.deadline is not None:
+                timeout = min(timeout, policy.deadline - (time.monotonic() - start))
+            sent = False
+            try:
+                client = self._acquire()
+                client.set_options(timeout=timeout, headers=headers)
+                sent = None
+                try:
+                    response = client.service.handle_rtml(payload)
+                finally:
+                    self._release(client)
+            except suds.WebFault:
+                self.breaker.success()  # The node agent is up and answered with a fault
+                raise
+            except Exception as e:
+                transient, maybe_sent = _transient(e)
+                if sent is None:
+                    sent = maybe_sent
+                if not transient:
+                    if trial:
+                        self.breaker.release()  # Inconclusive, let the next call try again
+                    if _http_status(e) is not None:
+                        raise LTTransportError('Error with connection to telescope: ' + str(e), sent) from e
+                    raise
+                delay = policy.delay(attempt)
+                # A failed trial is not retried, the node agent is still down
+                retry = not trial and attempt < policy.retries and (idempotent or sent is False)
+                if retry and policy.deadline is not None:
+                    retry = time.monotonic() - start + delay < policy.deadline
+                if not retry:
+                    # The breaker counts calls, so a call is only a failure once its retries are used up
+                    self.breaker.failure()
+                    raise LTTransportError('Error with connection to telescope: ' + str(e), sent) from e
+                with _timed(self.hooks, 'retry'):
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                if trial:
+                    self.breaker.release()
+                raise
+            self.breaker.success()
+            return response
+
+
+class _RateLimiter():
+    """
+    Spaces out calls so that no more than max_rps are started each second
+    """
+
+    def __init__(self, max_rps):
+        self.interval = 1.0 / max_rps if max_rps else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Blocks until the caller's slot comes round
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Constant part of the Schedule for each instrument device. These are parsed once
+# and deep copied for every schedule, leaving only the variable fields to fill in.
+_SCHEDULE_SKELETONS = {
+    'IO:O': '<Schedule><Device name="IO:O" type="camera"><SpectralRegion>optical</SpectralRegion>'
+            '<Setup><Filter type=""/><Detector><Binning><X units="pixels"/><Y units="pixels"/></Binning></Detector>'
+            '</Setup></Device><Exposure count=""><Value units="seconds"/></Exposure></Schedule>',
+    'IO:I': '<Schedule><Device name="IO:I" type="camera"><SpectralRegion>infrared</SpectralRegion>'
+            '<Setup><Filter type="H"/><Detector><Binning><X units="pixels">1</X><Y units="pixels">1</Y></Binning>'
+            '</Detector></Setup></Device><Exposure count=""><Value units="seconds"/></Exposure></Schedule>',
+    'Sprat': '<Schedule><Device name="Sprat" type="spectrograph"><SpectralRegion>optical</SpectralRegion>'
+             '<Setup><Grating name=""/><Detector><Binning><X units="pixels">1</X><Y units="pixels">1</Y></Binning>'
+             '</Detector></Setup></Device><Exposure count=""><Value units="seconds"/></Exposure></Schedule>',
+    'Moptop': '<Schedule><Device name="Moptop" type="polarimeter"><SpectralRegion>optical</SpectralRegion>'
+              '<Setup><Filter type=""/><Device rotorSpeed="" type="half-wave_plate"/></Setup></Device>'
+              '<Exposure count="1"><Value units="seconds"/></Exposure></Schedule>',
+    'FrodoSpec-Blue': '<Schedule><Device name="FrodoSpec-Blue" type="spectrograph"><SpectralRegion>optical</SpectralRegion>'
+                      '<Setup><Grating name=""/></Setup></Device>'
+                      '<Exposure count=""><Value units="seconds"/></Exposure></Schedule>',
+    'FrodoSpec-Red': '<Schedule><Device name="FrodoSpec-Red" type="spectrograph"><SpectralRegion>optical</SpectralRegion>'
+                     '<Setup><Grating name=""/></Setup></Device>'
+                     '<Exposure count=""><Value units="seconds"/></Exposure></Schedule>',
+}
+_SCHEDULE_TEMPLATES = {name: etree.fromstring(xml) for name, xml in _SCHEDULE_SKELETONS.items()}
+
+
+def _schedule_template(name):
+    """
+    Returns a fresh copy of the Schedule skeleton for an instrument device
+    """
+    return copy.deepcopy(_SCHEDULE_TEMPLATES[name])
+
+
+_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schemas', 'RTML-3.1a-ltrtml.xsd')
+_SCHEMAS = {}
+_SCHEMAS_LOCK = threading.Lock()
+
+
+class RTMLValidator():
+    """
+    Pre-flight check of RTML payloads against a local copy of the RTML schema.
+    Each schema file is compiled once and shared by every validator using it
+    """
+
+    def __init__(self, path=None):
+        """
+        Loads the schema at path, by default the schema bundled with ltrtml
+        """
+        self.path = path or _SCHEMA_PATH
+        with _SCHEMAS_LOCK:
+            if self.path not in _SCHEMAS:
+                _SCHEMAS[self.path] = (etree.XMLSchema(etree.parse(self.path)), threading.Lock())
+        self.schema, self._lock = _SCHEMAS[self.path]
+
+    def validate(self, payload):
+        """
+        Checks a payload from build_group against the schema.
+        Returns a list of errors giving the line and element of each problem, empty if it is valid
+        """
+        try:
+            document = etree.fromstring(payload)
+        except etree.XMLSyntaxError as e:
+            return [str(e)]
+        # A compiled schema keeps its error log on the object, so validations are not run at the same time
+        with self._lock:
+            if self.schema.validate(document):
+                return []
+            return ['line {0}, {1}: {2}'.format(error.line, error.path, error.message)
+                    for error in self.schema.error_log]
+
+
+class UIDGenerator():
+    """
+    Creates group uids of the form prefix_<unix time>_<worker>_<counter>.
+    The counter restarts each second and the worker defaults to the process id,
+    so uids stay unique between threads and processes submitting at the same time.
+    Generators with the same prefix and worker share one counter, so several
+    in a process never give the same uid
+    """
+
+    _lock = threading.Lock()
+    _counters = {}  # (prefix, worker) -> [second, next count]
+
+    def __init__(self, prefix, worker=None):
+        self.prefix = prefix
+        self.worker = worker
+
+    def __call__(self):
+        """
+        Returns the next uid
+        """
+        worker = self.worker if self.worker is not None else format(os.getpid(), 'x')
+        with UIDGenerator._lock:
+            counter = UIDGenerator._counters.setdefault((self.prefix, worker), [None, 0])
+            # If the clock steps back, keep counting in the last second used
+            second = int(time.time())
+            if counter[0] is not None and second <= counter[0]:
+                second = counter[0]
+            else:
+                counter[0] = second
+                counter[1] = 0
+            count = counter[1]
+            counter[1] += 1
+        return '{0}_{1}_{2}_{3}'.format(self.prefix, second, worker, count)
+
+
+_HASH_PARSERS = threading.local()
+
+
+def _payload_key(payload):
+    """
+    Returns the group uid of an RTML payload and its payload_hash
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('UTF-8')
+    parser = getattr(_HASH_PARSERS, 'parser', None)
+    if parser is None:
+        parser = _HASH_PARSERS.parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.fromstring(payload, parser)
+    uid = root.attrib.pop('uid', None)
+    return uid, hashlib.sha256(etree.tostring(root, method='c14n')).hexdigest()
+
+
+def payload_hash(payload):
+    """
+    Returns the sha256 hex digest of an RTML payload with the group uid left out.
+    It is taken over the canonical (C14N) form, so the same group gives the same
+    hash whether or not it was pretty printed
+    """
+    return _payload_key(payload)[1]
+
+
+RTMLResponse = namedtuple('RTMLResponse', ['mode', 'uid', 'errors', 'scores'])
+
+_RESPONSE_PARSERS = threading.local()
+
+
+def _response_parser():
+    """
+    Returns the XML parser for replies for the calling thread, reused between calls
+    """
+    parser = getattr(_RESPONSE_PARSERS, 'parser', None)
+    if parser is None:
+        parser = _RESPONSE_PARSERS.parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    return parser
+
+
+def _score(text):
+    """
+    Returns the value of a Score element as a float, or None if it is not a number
+    """
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def decode_response(response):
+    """
+    Decodes a reply from the node agent into an RTMLResponse of the mode ('confirm',
+    'reject', ...), the uid, the text of any Error elements and the value of any
+    Score elements. response is the str given by the SOAP call, which is fed to the
+    parser as it is despite its encoding declaration, or the raw bytes, which are
+    decoded with the declared encoding.
+    Raises etree.XMLSyntaxError if the reply is not XML
+    """
+    parser = _response_parser()
+    try:
+        if isinstance(response, bytes):
+            root = etree.fromstring(response, parser)
+        else:
+            parser.feed(response)
+            root = parser.close()
+    except etree.XMLSyntaxError:
+        _RESPONSE_PARSERS.parser = None  # Start the next reply with a clean parser
+        raise
+    errors = tuple((element.text or '').strip() for element in root.iter('{*}Error'))
+    scores = tuple(_score(element.text) for element in root.iter('{*}Score'))
+    return RTMLResponse(root.get('mode'), root.get('uid'), errors, scores)
+
+
+class LTRejection(list):
+    """
+    The error list returned when the telescope rejects a group or cancel,
+    as ['fail', error] from submit_group or [error] from cancel_group.
+    The decoded reply, with the reasons given by the telescope, is in response
+    """
+
+    def __init__(self, errors, response):
+        super().__init__(errors)
+        self.response = response
+
+
+def _rejection_reasons(response):
+    """
+    Returns the errors given in a reject reply for adding to an error string
+    """
+    if not response.errors:
+        return ''
+    return ': ' + '; '.join(response.errors)
+
+
+class LTLedger():
+    """
+    Indexed store of the group uids submitted to the telescope.
+    Backed by SQLite so appends and removals are keyed and several processes can share it.
+    Each uid is kept under a namespace, so several proposals can share one store
+    """
+
+    def __init__(self, path, namespace=''):
+        """
+        Opens (or creates) the store at path + '.db' and migrates any
+        uids left in an old path + '.pkl' pickle file.
+        Only the uids of namespace are seen through this object
+        """
+        self.path = path + '.db'
+        self.namespace = namespace
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS uids ('
+                         'uid TEXT PRIMARY KEY, '
+                         'submitted REAL, '
+                         'payload_hash TEXT, '
+                         'status TEXT, '
+                         "namespace TEXT NOT NULL DEFAULT '')")
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(uids)')]
+            if 'namespace' not in columns:
+                # Stores made before namespaces keep their uids in the default namespace
+                conn.execute("ALTER TABLE uids ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+            conn.execute('CREATE INDEX IF NOT EXISTS uids_payload_hash ON uids (payload_hash)')
+            conn.execute('CREATE INDEX IF NOT EXISTS uids_namespace ON uids (namespace)')
+        self._migrate(path + '.pkl')
+
+    def scoped(self, namespace):
+        """
+        Returns a view of the same store holding only the uids of namespace.
+        The view shares this object's connections
+        """
+        view = copy.copy(self)
+        view.namespace = namespace
+        return view
+
+    def _conn(self):
+        """
+        Returns the SQLite connection for the calling thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, pkl):
+        """
+        One-off import of the uid list from the pickle file used by earlier versions.
+        The pickle is renamed afterwards so it is only imported once
+        """
+        try:
+            with open(pkl, "rb") as rp:
+                uids = pickle.load(rp)
+            with self._conn() as conn:
+                conn.executemany('INSERT OR IGNORE INTO uids (uid, status, namespace) VALUES (?, ?, ?)',
+                                 [(uid, 'confirm', self.namespace) for uid in uids])
+            os.replace(pkl, pkl + '.migrated')
+        except FileNotFoundError:
+            # No pickle, or another process has already migrated it
+            pass
+
+    def add(self, uid, digest=None, status='confirm'):
+        """
+        Records a submitted uid with the submit time and the payload_hash of its
+        payload, if digest is given. status is 'confirm' for an accepted group or
+        'unknown' for one which may have been accepted
+        """
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO uids (uid, submitted, payload_hash, status, namespace) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (uid, time.time(), digest, status, self.namespace))
+
+    def find(self, digest, max_age=None):
+        """
+        Returns the uid of the latest accepted group with the given payload_hash,
+        submitted within the last max_age seconds if that is given, or None
+        """
+        query = "SELECT uid FROM uids WHERE payload_hash = ? AND namespace = ? AND status = 'confirm'"
+        args = (digest, self.namespace)
+        if max_age is not None:
+            query += ' AND submitted >= ?'
+            args += (time.time() - max_age,)
+        row = self._conn().execute(query + ' ORDER BY submitted DESC LIMIT 1', args).fetchone()
+        return row[0] if row else None
+
+    def reserve(self, uid, digest, max_age=None, pending_age=300):
+        """
+        Atomically checks for a group with the given payload_hash and, if there is
+        none, records uid as pending so identical groups sent at the same time, by
+        any thread or process, find it. Returns None when uid was reserved, or the
+        (uid, status) of the group found: 'confirm' for one accepted, or 'unknown'
+        for one which may have been accepted, within max_age seconds, or 'pending'
+        for one reserved in the last pending_age seconds
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            query = ("SELECT uid, status FROM uids WHERE payload_hash = ? AND namespace = ? AND ("
+                     "(status IN ('confirm', 'unknown') AND submitted >= ?) OR "
+                     "(status = 'pending' AND submitted >= ?)) "
+                     "ORDER BY status = 'confirm' DESC, status = 'unknown' DESC, submitted DESC LIMIT 1")
+            confirm_since = now - max_age if max_age is not None else float('-inf')
+            row = conn.execute(query, (digest, self.namespace, confirm_since, now - pending_age)).fetchone()
+            if row is not None:
+                return row
+            conn.execute('INSERT OR REPLACE INTO uids (uid, submitted, payload_hash, status, namespace) '
+                         "VALUES (?, ?, ?, 'pending', ?)", (uid, now, digest, self.namespace))
+        return None
+
+    def release(self, uid):
+        """
+        Removes uid if it is still only reserved by reserve
+        """
+        with self._conn() as conn:
+            conn.execute("DELETE FROM uids WHERE uid = ? AND namespace = ? AND status = 'pending'",
+                         (uid, self.namespace))
+
+    def adopt(self, path):
+        """
+        Moves the uids of a single proposal store, path + '.db' or an old path + '.pkl'
+        pickle, into this namespace. Used when a proposal moves to an LTManager so
+        its earlier groups can still be listed and cancelled. Moved uids are removed
+        from the old store, so they are only moved once
+        """
+        if not (os.path.exists(path + '.db') or os.path.exists(path + '.pkl')):
+            return
+        source = LTLedger(path)
+        if os.path.abspath(source.path) == os.path.abspath(self.path):
+            with self._conn() as conn:
+                conn.execute("UPDATE uids SET namespace = ? WHERE namespace = '' AND status != 'pending'",
+                             (self.namespace,))
+            return
+        rows = source._conn().execute("SELECT uid, submitted, payload_hash, status FROM uids "
+                                      "WHERE namespace = '' AND status != 'pending' ORDER BY rowid").fetchall()
+        with self._conn() as conn:
+            conn.executemany('INSERT OR IGNORE INTO uids (uid, submitted, payload_hash, status, namespace) '
+                             'VALUES (?, ?, ?, ?, ?)', [row + (self.namespace,) for row in rows])
+        with source._conn() as conn:
+            conn.executemany("DELETE FROM uids WHERE uid = ? AND namespace = ''", [(row[0],) for row in rows])
+
+    def get(self, uid):
+        """
+        Returns the (uid, submitted, payload_hash, status) record for uid, or None
+        """
+        return self._conn().execute('SELECT uid, submitted, payload_hash, status FROM uids '
+                                    'WHERE uid = ? AND namespace = ?', (uid, self.namespace)).fetchone()
+
+    def remove(self, uids):
+        """
+        Removes the given uids in a single transaction
+        """
+        with self._conn() as conn:
+            conn.executemany('DELETE FROM uids WHERE uid = ? AND namespace = ?',
+                             [(uid, self.namespace) for uid in uids])
+
+    def uids(self):
+        """
+        Returns the stored uids in submission order, leaving out groups still being
+        sent and those which may or may not have been accepted
+        """
+        return [row[0] for row in self._conn().execute("SELECT uid FROM uids WHERE namespace = ? "
+                                                       "AND status NOT IN ('pending', 'unknown') ORDER BY rowid",
+                                                       (self.namespace,))]
+
+
+def _pretty_xml(text):
+    """
+    Returns an XML string re-indented for reading, or unchanged if it does not parse
+    """
+    try:
+        root = etree.fromstring(text, etree.XMLParser(remove_blank_text=True))
+    except (etree.XMLSyntaxError, ValueError):
+        return text
+    return etree.tostring(root, encoding='unicode', pretty_print=True)
+
+
+_SEGMENT_SERIAL = itertools.count()  # Shared by every archive in the process so names never repeat
+_OPEN_SEGMENTS = set()  # Paths of the segments being written in this process
+_OPEN_SEGMENTS_LOCK = threading.Lock()
+
+
+def _segment_pid(segment):
+    """
+    Returns the process id in a segment name, or None if it has none
+    """
+    try:
+        return int(segment.split('_')[2], 16)
+    except (IndexError, ValueError):
+        return None
+
+
+def _pid_running(pid):
+    """
+    Returns False only if no process with this id is running. Assumed running
+    where it cannot be checked
+    """
+    if pid is None or os.name != 'posix':
+        return pid is not None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class DebugArchive():
+    """
+    Archive of the RTML sent to and received from the telescope, kept for debugging.
+    Records are queued and written by a background thread into gzip JSONL segments
+    in directory. A segment is closed once it reaches segment_bytes and the oldest
+    are deleted so no more than max_segments are kept. An SQLite index in the
+    directory finds records by uid and time without reading every segment
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_segments=8, queue_size=10000,
+                 pretty_print=True):
+        """
+        Creates directory if needed. Nothing is written until the first record.
+        With pretty_print the requests are indented by the writer thread, so they
+        are easy to read without the payloads sent being pretty printed
+        """
+        self.directory = directory
+        self.pretty_print = pretty_print
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._segment = None
+        self._lines = 0
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, 'index.db')
+        with self._index() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS records ('
+                         'uid TEXT, '
+                         'time REAL, '
+                         'kind TEXT, '
+                         'segment TEXT, '
+                         'line INTEGER)')
+            conn.execute('CREATE INDEX IF NOT EXISTS records_uid ON records (uid)')
+            conn.execute('CREATE INDEX IF NOT EXISTS records_time ON records (time)')
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Makes an archive from the optional DEBUG_DIR, DEBUG_SEGMENT_BYTES,
+        DEBUG_SEGMENTS and DEBUG_PRETTY settings
+        """
+        return cls(settings.get('DEBUG_DIR', 'ltrtml_debug'),
+                   settings.get('DEBUG_SEGMENT_BYTES', 16 * 1024 * 1024),
+                   settings.get('DEBUG_SEGMENTS', 8),
+                   pretty_print=settings.get('DEBUG_PRETTY', True))
+
+    def _index(self):
+        """
+        Opens a connection to the index
+        """
+        conn = sqlite3.connect(self._index_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def record(self, kind, uid, request, response):
+        """
+        Queues a request and its response for writing and returns straight away.
+        If the writer has fallen queue_size records behind the record is dropped
+        and counted in dropped rather than holding up the caller
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ltrtml-debug', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        try:
+            self._queue.put_nowait({'time': time.time(), 'kind': kind, 'uid': uid,
+                                    'request': request, 'response': response})
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """
+        Waits until every queued record has been written
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes any queued records, stops the writer and closes the open segment
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self):
+        """
+        Writer thread. Takes whatever has been queued, writes it as one batch
+        and repeats until close puts None on the queue
+        """
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in batch if item is not None]
+            stop = len(records) < len(batch)
+            try:
+                if records:
+                    self._write(records)
+                if stop:
+                    self._close_segment()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, records):
+        """
+        Appends records to the current segment, starting a new one first if it is full
+        """
+        if self._file is not None and self._file.fileobj.tell() >= self.segment_bytes:
+            self._close_segment()
+        if self._file is None:
+            self._open_segment()
+        rows = []
+        for item in records:
+            if self.pretty_print:
+                item['request'] = _pretty_xml(item['request'])
+            self._file.write(json.dumps(item).encode('UTF-8') + b'\n')
+            rows.append((item['uid'], item['time'], item['kind'], self._segment, self._lines))
+            self._lines += 1
+        # A sync flush makes everything written so far readable while the segment is still open
+        self._file.flush(zlib.Z_SYNC_FLUSH)
+        with self._index() as conn:
+            conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?)', rows)
+
+    def _open_segment(self):
+        """
+        Starts a new segment and deletes the oldest if there are more than max_segments
+        """
+        while True:
+            self._segment = 'debug_{0}_{1:x}_{2}.jsonl.gz'.format(
+                time.strftime('%Y%m%dT%H%M%S', time.gmtime()), os.getpid(), next(_SEGMENT_SERIAL))
+            try:
+                # 'x' so a segment already in the directory is never overwritten
+                self._file = gzip.open(os.path.join(self.directory, self._segment), 'xb')
+                break
+            except FileExistsError:
+                continue
+        with _OPEN_SEGMENTS_LOCK:
+            _OPEN_SEGMENTS.add(os.path.join(self.directory, self._segment))
+        self._lines = 0
+        self._prune()
+
+    def _close_segment(self):
+        """
+        Finishes the current segment
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            with _OPEN_SEGMENTS_LOCK:
+                _OPEN_SEGMENTS.discard(os.path.join(self.directory, self._segment))
+
+    def _prune(self):
+        """
+        Deletes the oldest segments, and their index entries, beyond max_segments.
+        Segments another writer may still have open are left alone: those open in
+        this process and the newest segment of each other process still running
+        """
+        segments = self.segments()
+        with _OPEN_SEGMENTS_LOCK:
+            open_here = set(_OPEN_SEGMENTS)
+        newest = {}
+        for segment in segments:
+            newest[_segment_pid(segment)] = segment
+        in_use = {segment for pid, segment in newest.items() if pid != os.getpid() and _pid_running(pid)}
+        closed = [segment for segment in segments
+                  if segment not in in_use and os.path.join(self.directory, segment) not in open_here]
+        old = closed[:max(len(segments) - self.max_segments, 0)]
+        for segment in old:
+            try:
+                os.remove(os.path.join(self.directory, segment))
+            except FileNotFoundError:
+                pass
+        if old:
+            with self._index() as conn:
+                conn.executemany('DELETE FROM records WHERE segment = ?', [(segment,) for segment in old])
+
+    def segments(self):
+        """
+        Returns the names of the segments in the directory, oldest first
+        """
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith('debug_') and name.endswith('.jsonl.gz')]
+        return sorted(names, key=lambda name: (os.path.getmtime(os.path.join(self.directory, name)), name))
+
+    def find(self, uid=None, start=None, end=None):
+        """
+        Returns the records for uid, or for every uid if None, written between the
+        unix times start and end (either may be None), oldest first.
+        Each record is a dict of time, kind ('submit' or 'cancel'), uid, request and response
+        """
+        query = 'SELECT segment, line FROM records WHERE 1'
+        args = []
+        if uid is not None:
+            query += ' AND uid = ?'
+            args.append(uid)
+        if start is not None:
+            query += ' AND time >= ?'
+            args.append(start)
+        if end is not None:
+            query += ' AND time <= ?'
+            args.append(end)
+        conn = self._index()
+        try:
+            rows = conn.execute(query + ' ORDER BY time', args).fetchall()
+        finally:
+            conn.close()
+        wanted = defaultdict(set)
+        for segment, line in rows:
+            wanted[segment].add(line)
+        found = {}
+        for segment, lines in wanted.items():
+            try:
+                with gzip.open(os.path.join(self.directory, segment), 'rb') as f:
+                    for number, text in enumerate(f):
+                        if number in lines:
+                            found[segment, number] = json.loads(text)
+            except FileNotFoundError:
+                # Deleted since the index was read
+                pass
+            except EOFError:
+                # The segment is still open, so has no gzip trailer yet
+                pass
+            except (OSError, zlib.error):
+                # A damaged segment, keep the records read before the damage
+                pass
+        return [found[row] for row in rows if row in found]
+
+
+def _bounded_map(func, items, max_workers):
+    """
+    Like ThreadPoolExecutor.map, yielding results in input order, but only reads
+    ahead of the results by a few items, so items can come from a long generator
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for item in items:
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+class _FairScheduler():
+    """
+    Runs queued calls on a fixed set of worker threads, taking one call from each
+    key in turn. A key with a long queue waits its turn like the others, so a burst
+    for one key cannot hold up calls queued for the rest.
+    No more than max_rps calls are started each second across all keys
+    """
+
+    def __init__(self, max_workers, max_rps=0):
+        self._queues = {}
+        self._ring = deque()  # Keys with queued calls, in the order they are served
+        self._cond = threading.Condition()
+        self._limiter = _RateLimiter(max_rps)
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, name='ltrtml-scheduler', daemon=True)
+                         for _ in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Queues func(*args, **kwargs) under key and returns a Future for its result
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Scheduler is closed')
+            if key not in self._queues:
+                self._queues[key] = deque()
+                self._ring.append(key)
+            self._queues[key].append((future, func, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def pending(self):
+        """
+        Returns the number of queued calls for each key
+        """
+        with self._cond:
+            return {key: len(calls) for key, calls in self._queues.items()}
+
+    def _next(self):
+        """
+        Waits for and returns the next call, or None once closed and empty
+        """
+        with self._cond:
+            while not self._ring:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            key = self._ring.popleft()
+            calls = self._queues[key]
+            call = calls.popleft()
+            if calls:
+                self._ring.append(key)
+            else:
+                del self._queues[key]
+            return call
+
+    def _run(self):
+        while True:
+            call = self._next()
+            if call is None:
+                return
+            future, func, args, kwargs = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._limiter.wait()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def close(self):
+        """
+        Runs the calls already queued and stops the workers
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+IOO_FILTERS = ('U', 'R', 'G', 'I', 'Z', 'B', 'V',
+               'Halpha6566', 'Halpha6634', 'Halpha6705', 'Halpha6755', 'Halpha6822')
+MOPTOP_FILTERS = ('B', 'V', 'R', 'I', 'L')
+
+
+def _number(value):
+    """
+    Formats a number for the RTML, without a trailing '.0' on whole numbers
+    """
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _seconds(value):
+    """
+    Formats the seconds of a sexagesimal value with two integer digits
+    """
+    text = _number(value)
+    return '0' + text if value < 10 else text
+
+
+def _positive(name, value, kind=float):
+    """
+    Converts value to kind, raising ValueError unless it is greater than zero
+    """
+    try:
+        value = kind(value)
+    except (TypeError, ValueError):
+        raise ValueError('{0} must be a number, not {1!r}'.format(name, value))
+    if not value > 0:
+        raise ValueError('{0} must be greater than zero'.format(name))
+    return value
+
+
+def _sexagesimal(value, signed):
+    """
+    Splits 'XX:MM:SS.SS' (with a leading sign if signed) into sign, whole, minutes and seconds
+    """
+    text = str(value).strip()
+    sign = '+'
+    if signed:
+        if text[:1] not in ('+', '-'):
+            raise ValueError('{0!r} must start with + or -'.format(value))
+        sign, text = text[0], text[1:]
+    try:
+        whole, minutes, seconds = text.split(':')
+        if any(part.strip()[:1] in ('+', '-') for part in (whole, minutes, seconds)):
+            raise ValueError('sign inside value')
+        return sign, int(whole), int(minutes), float(seconds)
+    except ValueError:
+        raise ValueError('{0!r} is not formatted as {1}'.format(value, '+/-DD:MM:SS.SS' if signed else 'HH:MM:SS.SS'))
+
+
+def _degrees(value):
+    """
+    Returns value as a float if it is a number or a decimal string, or None for sexagesimal text
+    """
+    if isinstance(value, str):
+        if ':' in value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError('{0!r} is neither sexagesimal nor decimal degrees'.format(value))
+    return float(value)
+
+
+@dataclass(frozen=True)
+class Target():
+    """
+    An observation target. Build with Target.parse(name, ra, dec) from sexagesimal
+    strings or decimal degrees, or Target.from_dict(target) from a target dict
+    """
+    __slots__ = ('name', 'ra_h', 'ra_m', 'ra_s', 'dec_sign', 'dec_d', 'dec_m', 'dec_s')
+    name: str
+    ra_h: int
+    ra_m: int
+    ra_s: float
+    dec_sign: str
+    dec_d: int
+    dec_m: int
+    dec_s: float
+
+    def __post_init__(self):
+        if not self.name:
+            raise ValueError('Target needs a name')
+        if not (0 <= self.ra_h < 24 and 0 <= self.ra_m < 60 and 0 <= self.ra_s < 60):
+            raise ValueError('RA of {0} out of range'.format(self.name))
+        if self.dec_sign not in ('+', '-') or not (0 <= self.dec_d and 0 <= self.dec_m < 60 and 0 <= self.dec_s < 60):
+            raise ValueError('DEC of {0} out of range'.format(self.name))
+        if self.dec_d + self.dec_m / 60 + self.dec_s / 3600 > 90:
+            raise ValueError('DEC of {0} out of range'.format(self.name))
+
+    @classmethod
+    def parse(cls, name, ra, dec):
+        """
+        Makes a Target from RA 'HH:MM:SS.SS' and DEC '+/-DD:MM:SS.SS' strings, or from
+        RA and DEC in decimal degrees, given as numbers or strings such as '150.25'
+        """
+        ra_degrees, dec_degrees = _degrees(ra), _degrees(dec)
+        if ra_degrees is not None:
+            if not 0 <= ra_degrees < 360:
+                raise ValueError('RA of {0} out of range'.format(name))
+            ms = int(round(ra_degrees * 240000)) % 86400000
+            ra_h, ra_m, ra_s = ms // 3600000, ms // 60000 % 60, ms % 60000 / 1000
+        else:
+            _, ra_h, ra_m, ra_s = _sexagesimal(ra, signed=False)
+        if dec_degrees is not None:
+            dec = dec_degrees
+            cas = int(round(abs(dec) * 360000))
+            dec_sign = '-' if dec < 0 and cas else '+'
+            dec_d, dec_m, dec_s = cas // 360000, cas // 6000 % 60, cas % 6000 / 100
+        else:
+            dec_sign, dec_d, dec_m, dec_s = _sexagesimal(dec, signed=True)
+        return cls(str(name), ra_h, ra_m, ra_s, dec_sign, dec_d, dec_m, dec_s)
+
+    @classmethod
+    def from_dict(cls, target):
+        """
+        Makes a Target from a dict with 'name', 'RA' and 'DEC' keys
+        """
+        return cls.parse(target['name'], target['RA'], target['DEC'])
+
+    @property
+    def ra(self):
+        return '{0:02d}:{1:02d}:{2}'.format(self.ra_h, self.ra_m, _seconds(self.ra_s))
+
+    @property
+    def dec(self):
+        return '{0}{1:02d}:{2:02d}:{3}'.format(self.dec_sign, self.dec_d, self.dec_m, _seconds(self.dec_s))
+
+
+def _parse_datetime(date, time_of_day):
+    """
+    Makes a datetime from 'YYYY-MM-DD' and 'HH:MM:SS.SS' strings
+    """
+    try:
+        hour, minute, second = time_of_day.split(':')
+        second = float(second)
+        return datetime.datetime.strptime(date, '%Y-%m-%d').replace(
+            hour=int(hour), minute=int(minute), second=int(second),
+            microsecond=int(round(second % 1 * 1e6)))
+    except (AttributeError, ValueError):
+        raise ValueError('{0!r} {1!r} is not a date and time formatted as YYYY-MM-DD HH:MM:SS'.format(date, time_of_day))
+
+
+@dataclass(frozen=True)
+class Constraints():
+    """
+    Observing constraints applied to every observation in a group.
+    start and end are UTC datetimes
+    """
+    __slots__ = ('air_mass', 'sky_bright', 'seeing', 'photometric', 'start', 'end')
+    air_mass: float
+    sky_bright: float
+    seeing: float
+    photometric: bool
+    start: datetime.datetime
+    end: datetime.datetime
+
+    def __post_init__(self):
+        object.__setattr__(self, 'air_mass', _positive('air_mass', self.air_mass))
+        object.__setattr__(self, 'sky_bright', float(self.sky_bright))
+        object.__setattr__(self, 'seeing', _positive('seeing', self.seeing))
+        if not isinstance(self.photometric, bool):
+            raise ValueError('photometric must be True or False')
+        if self.end <= self.start:
+            raise ValueError('end must be after start')
+
+    @classmethod
+    def from_dict(cls, constraints):
+        """
+        Makes Constraints from a constraints dict of strings as shown in example.py
+        """
+        for k, v in constraints.items():
+            if v == '':
+                raise ValueError('No value for ' + k)
+        if constraints['photometric'] not in ('yes', 'no'):
+            raise ValueError('Please chose yes or no for photometric')
+        return cls(constraints['air_mass'],
+                   constraints['sky_bright'],
+                   constraints['seeing'],
+                   constraints['photometric'] == 'yes',
+                   _parse_datetime(constraints['start_date'], constraints['start_time']),
+                   _parse_datetime(constraints['end_date'], constraints['end_time']))
+
+
+@dataclass(frozen=True)
+class IOO():
+    """
+    IO:O imaging. filters is a tuple of (filter, exp_time, exp_count) with the
+    filter taken from IOO_FILTERS, and binning is 1 or 2
+    """
+    __slots__ = ('target', 'filters', 'binning')
+    instrument = 'IO:O'
+    target: Target
+    filters: tuple
+    binning: int
+
+    def __post_init__(self):
+        filters = tuple((str(name), _positive('exp_time', exp_time), _positive('exp_count', exp_count, int))
+                        for name, exp_time, exp_count in self.filters)
+        for name, exp_time, exp_count in filters:
+            if name not in IOO_FILTERS:
+                raise ValueError('Filter {0} not available for IO:O, choose from {1}'.format(name, IOO_FILTERS))
+        object.__setattr__(self, 'filters', filters)
+        object.__setattr__(self, 'binning', _positive('binning', self.binning, int))
+
+    @classmethod
+    def from_dict(cls, observation):
+        filters = tuple((name, f['exp_time'], f['exp_count']) for name, f in observation['filters'].items())
+        return cls(_target(observation['target']), filters, observation['binning'])
+
+
+@dataclass(frozen=True)
+class IOI():
+    """
+    IO:I H band imaging
+    """
+    __slots__ = ('target', 'exp_time', 'exp_count')
+    instrument = 'IO:I'
+    target: Target
+    exp_time: float
+    exp_count: int
+
+    def __post_init__(self):
+        object.__setattr__(self, 'exp_time', _positive('exp_time', self.exp_time))
+        object.__setattr__(self, 'exp_count', _positive('exp_count', self.exp_count, int))
+
+    @classmethod
+    def from_dict(cls, observation):
+        return cls(_target(observation['target']), observation['exp_time'], observation['exp_count'])
+
+
+@dataclass(frozen=True)
+class Sprat():
+    """
+    Sprat spectroscopy with the 'red' or 'blue' grating
+    """
+    __slots__ = ('target', 'exp_time', 'exp_count', 'grating')
+    instrument = 'Sprat'
+    target: Target
+    exp_time: float
+    exp_count: int
+    grating: str
+
+    def __post_init__(self):
+        object.__setattr__(self, 'exp_time', _positive('exp_time', self.exp_time))
+        object.__setattr__(self, 'exp_count', _positive('exp_count', self.exp_count, int))
+        if self.grating not in ('red', 'blue'):
+            raise ValueError('Enter either "red" or "blue" in grating')
+
+    @classmethod
+    def from_dict(cls, observation):
+        return cls(_target(observation['target']), observation['exp_time'], observation['exp_count'],
+                   observation['grating'])
+
+
+@dataclass(frozen=True)
+class Frodo():
+    """
+    FRODOSpec spectroscopy with both arms, each with 'high' or 'low' resolution
+    """
+    __slots__ = ('target', 'exp_time_blue', 'exp_count_blue', 'res_blue',
+                 'exp_time_red', 'exp_count_red', 'res_red')
+    instrument = 'Frodo'
+    target: Target
+    exp_time_blue: float
+    exp_count_blue: int
+    res_blue: str
+    exp_time_red: float
+    exp_count_red: int
+    res_red: str
+
+    def __post_init__(self):
+        for colour in ('blue', 'red'):
+            object.__setattr__(self, 'exp_time_' + colour,
+                               _positive('exp_time_' + colour, getattr(self, 'exp_time_' + colour)))
+            object.__setattr__(self, 'exp_count_' + colour,
+                               _positive('exp_count_' + colour, getattr(self, 'exp_count_' + colour), int))
+            if getattr(self, 'res_' + colour) not in ('high', 'low'):
+                raise ValueError('Enter either "high" or "low" in res_' + colour)
+
+    @classmethod
+    def from_dict(cls, observation):
+        return cls(_target(observation['target']),
+                   observation['exp_time_Blue'], observation['exp_count_Blue'], observation['res_Blue'],
+                   observation['exp_time_Red'], observation['exp_count_Red'], observation['res_Red'])
+
+
+@dataclass(frozen=True)
+class Moptop():
+    """
+    Moptop polarimetry. filters is a tuple of (filter, exp_time, rot_speed) with the
+    filter taken from MOPTOP_FILTERS and rot_speed 'fast' or 'slow'
+    """
+    __slots__ = ('target', 'filters')
+    instrument = 'Moptop'
+    target: Target
+    filters: tuple
+
+    def __post_init__(self):
+        filters = tuple((str(name), _positive('exp_time', exp_time), rot_speed)
+                        for name, exp_time, rot_speed in self.filters)
+        for name, exp_time, rot_speed in filters:
+            if name not in MOPTOP_FILTERS:
+                raise ValueError('Filter {0} not available for Moptop, choose from {1}'.format(name, MOPTOP_FILTERS))
+            if rot_speed not in ('fast', 'slow'):
+                raise ValueError('Enter either "fast" or "slow" in rot_speed')
+        object.__setattr__(self, 'filters', filters)
+
+    @classmethod
+    def from_dict(cls, observation):
+        filters = tuple((name, f['exp_time'], f['rot_speed']) for name, f in observation['filters'].items())
+        return cls(_target(observation['target']), filters)
+
+
+INSTRUMENTS = {model.instrument: model for model in (IOO, IOI, Sprat, Frodo, Moptop)}
+
+
+def _target(target):
+    """
+    Returns target as a Target, converting it from a target dict if needed
+    """
+    if isinstance(target, Target):
+        return target
+    return Target.from_dict(target)
+
+
+def observation_from_dict(observation):
+    """
+    Converts an observation dict, as shown in example.py, to its instrument model
+    """
+    model = INSTRUMENTS.get(observation['instrument'])
+    if model is None:
+        raise ValueError('Instrument ' + observation['instrument'] + ' not supported')
+    return model.from_dict(observation)
+
+
+class _StreamedPayload():
+    """
+    Stands in for the RTML root element while a group is streamed. Each element
+    appended is written straight out rather than kept in a tree. With timed, the
+    time spent writing is added up in seconds
+    """
+
+    def __init__(self, xf, timed=False):
+        self._xf = xf
+        self.seconds = 0.0 if timed else None
+
+    def append(self, element):
+        if self.seconds is None:
+            self._xf.write(element)
+            return
+        start = time.perf_counter()
+        self._xf.write(element)
+        self.seconds += time.perf_counter() - start
+
+
 class LTObs():
     """
     LT Observation Class to create and send Observation Groups to the Liverpool telescope
     Using and RTML Payload over a SOAP connection
     """
 
-    def __init__(self, settings):
+    def __init__(self, settings, uid_generator=None, policy=None, session=None, ledger=None):
         """
         Loads Settings and checks for any missing
-        information within the settings dict
+        information within the settings dict.
+        uid_generator is any callable returning a new group uid,
+        by default a UIDGenerator using settings['prefix'].
+        policy is the TransportPolicy for the connection, by default made from the settings.
+        session and ledger let several objects share an LTSession and an LTLedger
+        store (see LTManager). The object then uses the session's hooks
         """
         self.settings = settings
-        self.pickle = settings['PKLFILE'] + '.pkl'
         for k, v in self.settings.items():
             if v == '':
                 print('Please enter your: ' + k)
                 exit()
+        self.headers = {
+            'Username': settings['username'],
+            'Password': settings['rtmlpass']
+        }
+        if session is None:
+            session = LTSession(settings, policy)
+        self.session = session
+        self.hooks = session.hooks
+        if ledger is None:
+            ledger = LTLedger(settings['PKLFILE'])
+        self.ledger = ledger
+        if uid_generator is None:
+            uid_generator = UIDGenerator(settings['prefix'], settings.get('WORKER_ID'))
+        self.uid_generator = uid_generator
+        if settings.get('VALIDATE'):
+            self.validator = RTMLValidator(settings.get('RTML_SCHEMA'))
+        else:
+            self.validator = None
+        self.pretty_print = settings.get('PRETTY_PRINT', False)
+        if settings['DEBUG']:
+            self.debug = DebugArchive.from_settings(settings)
+        else:
+            self.debug = None
+
+    def add_hook(self, hook):
+        """
+        Registers hook(phase, seconds) to be called with the wall time of each phase
+        of submitting and cancelling, e.g. an LTMetrics object
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Stops calling a hook registered with add_hook
+        """
+        self.hooks.remove(hook)
 
     def _build_prolog(self):
         """
@@ -41,7 +1609,7 @@ class LTObs():
                              {schemaLocation: LT_SCHEMA_LOCATION},
                              xmlns=LT_XML_NS,
                              mode='request',
-                             uid=self.settings['prefix'] + '_' + format(str(int(time.time()))),
+                             uid=self.uid_generator(),
                              version='3.1a',
                              nsmap=namespaces)
 
@@ -55,333 +1623,827 @@ class LTObs():
         etree.SubElement(contact, 'Name').text = ''
         payload.append(project)
 
-    def _build_inst_schedule_IOI(self, observation, payload):
+    def _build_inst_schedule_IOI(self, observation, constraints, payload, cache=None):
         """
         Builds the schedule with the target and constraints attached to be sent to
         the LT for use of the IO:I instrument
         """
-        target = observation['target']
-        constraints = observation['constraints']
-        schedule = etree.Element('Schedule')
-        device = etree.SubElement(schedule, 'Device', name="IO:I", type="camera")
-        etree.SubElement(device, 'SpectralRegion').text = 'infrared'
-        setup = etree.SubElement(device, 'Setup')
-        etree.SubElement(setup, 'Filter', type='H')
-        detector = etree.SubElement(setup, 'Detector')
-        binning = etree.SubElement(detector, 'Binning')
-        etree.SubElement(binning, 'X', units='pixels').text = '1'
-        etree.SubElement(binning, 'Y', units='pixels').text = '1'
-        exposure = etree.SubElement(schedule, 'Exposure', count=observation['exp_count'])
-        etree.SubElement(exposure, 'Value', units='seconds').text = observation['exp_time']
-        schedule.append(self._build_target(target))
-        for const in self._build_constraints(constraints):
+        schedule = _schedule_template('IO:I')
+        exposure = schedule[1]
+        exposure.set('count', str(observation.exp_count))
+        exposure[0].text = _number(observation.exp_time)
+        schedule.append(self._cached_target(observation.target, cache))
+        for const in self._cached_constraints(constraints, cache):
             schedule.append(const)
         payload.append(schedule)
 
-    def _build_inst_schedule_Sprat(self, observation, payload):
+    def _build_inst_schedule_Sprat(self, observation, constraints, payload, cache=None):
         """
         Builds the schedule with the target and constraints attached to be sent to
         the LT for use of the Sprat instrument
         """
-        target = observation['target']
-        constraints = observation['constraints']
-        if observation['grating'] == 'red' or observation['grating'] == 'blue':
-            pass
-        else:
-            print('Enter either "red" or "blue" in grating')
-            exit()
-        schedule = etree.Element('Schedule')
-        device = etree.SubElement(schedule, 'Device', name="Sprat", type="spectrograph")
-        etree.SubElement(device, 'SpectralRegion').text = 'optical'
-        setup = etree.SubElement(device, 'Setup')
-        etree.SubElement(setup, 'Grating', name=observation['grating'])
-        detector = etree.SubElement(setup, 'Detector')
-        binning = etree.SubElement(detector, 'Binning')
-        etree.SubElement(binning, 'X', units='pixels').text = '1'
-        etree.SubElement(binning, 'Y', units='pixels').text = '1'
-        exposure = etree.SubElement(schedule, 'Exposure', count=observation['exp_count'])
-        etree.SubElement(exposure, 'Value', units='seconds').text = observation['exp_time']
-        schedule.append(self._build_target(target))
-        for const in self._build_constraints(constraints):
+        schedule = _schedule_template('Sprat')
+        device, exposure = schedule
+        device[1][0].set('name', observation.grating)
+        exposure.set('count', str(observation.exp_count))
+        exposure[0].text = _number(observation.exp_time)
+        schedule.append(self._cached_target(observation.target, cache))
+        for const in self._cached_constraints(constraints, cache):
             schedule.append(const)
         payload.append(schedule)
 
-    def _build_inst_schedule_IOO(self, observation, payload):
+    def _build_inst_schedule_IOO(self, observation, constraints, payload, cache=None):
         """
         Builds the schedule with the target and constraints attached to be sent to
         the LT for use of the multi-filter IO:O instrument
         """
-        self.filters = ['U',
-                        'R',
-                        'G',
-                        'I',
-                        'Z',
-                        'B',
-                        'V',
-                        'Halpha6566',
-                        'Halpha6634',
-                        'Halpha6705',
-                        'Halpha6755',
-                        'Halpha6822']
-        target = observation['target']
-        constraints = observation['constraints']
-        for filter in observation['filters']:
-            if filter in self.filters:
-                schedule = etree.Element('Schedule')
-                device = etree.SubElement(schedule, 'Device', name=observation['instrument'], type='camera')
-                etree.SubElement(device, 'SpectralRegion').text = 'optical'
-                setup = etree.SubElement(device, 'Setup')
-                etree.SubElement(setup, 'Filter', type=str(filter))
-                detector = etree.SubElement(setup, 'Detector')
-                binning = etree.SubElement(detector, 'Binning')
-                etree.SubElement(binning, 'X', units='pixels').text = observation['binning']
-                etree.SubElement(binning, 'Y', units='pixels').text = observation['binning']
-                exposure = etree.SubElement(schedule, 'Exposure', count=observation['filters'][filter]['exp_count'])
-                etree.SubElement(exposure, 'Value', units='seconds'). text = observation['filters'][filter]['exp_time']
-                schedule.append(self._build_target(target))
-                for const in self._build_constraints(constraints):
-                    schedule.append(const)
-                payload.append(schedule)
-            else:
-                print('selected filter/s not available for IO:O.')
-                print('Please select a filter from the provided list.')
-                print(self.filters)
-                exit()
+        for filter, exp_time, exp_count in observation.filters:
+            schedule = _schedule_template('IO:O')
+            device, exposure = schedule
+            setup = device[1]
+            setup[0].set('type', filter)
+            bin_x, bin_y = setup[1][0]
+            bin_x.text = bin_y.text = str(observation.binning)
+            exposure.set('count', str(exp_count))
+            exposure[0].text = _number(exp_time)
+            schedule.append(self._cached_target(observation.target, cache))
+            for const in self._cached_constraints(constraints, cache):
+                schedule.append(const)
+            payload.append(schedule)
 
-    def _build_inst_schedule_Moptop(self, observation, payload):
+    def _build_inst_schedule_Moptop(self, observation, constraints, payload, cache=None):
         """
         Builds the schedule with the target and constraints attached to be sent to
-        the LT for use of the multi-filter IO:O instrument
+        the LT for use of the multi-filter Moptop instrument
         """
-        self.filters = ['B',
-                        'V',
-                        'R',
-                        'I',
-                        'L']
-        target = observation['target']
-        constraints = observation['constraints']
-        for filter in observation['filters']:
-            if filter in self.filters:
-                schedule = etree.Element('Schedule')
-                device = etree.SubElement(schedule, 'Device', name=observation['instrument'], type='polarimeter')
-                etree.SubElement(device, 'SpectralRegion').text = 'optical'
-                setup = etree.SubElement(device, 'Setup')
-                etree.SubElement(setup, 'Filter', type=str(filter))
-                etree.SubElement(setup, 'Device', rotorSpeed=observation['filters'][filter]['rot_speed'], type='half-wave_plate')
-                exposure = etree.SubElement(schedule, 'Exposure', count='1')
-                etree.SubElement(exposure, 'Value', units='seconds'). text = observation['filters'][filter]['exp_time']
-                schedule.append(self._build_target(target))
-                for const in self._build_constraints(constraints):
-                    schedule.append(const)
-                payload.append(schedule)
-            else:
-                print('selected filter/s not available for IO:O.')
-                print('Please select a filter from the provided list.')
-                print(self.filters)
-                exit()
+        for filter, exp_time, rot_speed in observation.filters:
+            schedule = _schedule_template('Moptop')
+            device, exposure = schedule
+            filter_element, rotor = device[1]
+            filter_element.set('type', filter)
+            rotor.set('rotorSpeed', rot_speed)
+            exposure[0].text = _number(exp_time)
+            schedule.append(self._cached_target(observation.target, cache))
+            for const in self._cached_constraints(constraints, cache):
+                schedule.append(const)
+            payload.append(schedule)
 
-    def _build_inst_schedule_Frodo(self, observation, payload):
+    def _build_inst_schedule_Frodo(self, observation, constraints, payload, cache=None):
         """
         Builds the schedule with the target and constraints attached to be sent to
         the LT for use of both blue and red arms of the Frodo instrument
         """
-        target = observation['target']
-        constraints = observation['constraints']
-        colours = ('Blue', 'Red')
-        for colour in colours:  # builds schedule for each colour arm of Frodo
-            res = observation['res_{}'.format(colour)]
-            time = observation['exp_time_{}'.format(colour)]
-            count = observation['exp_count_{}'.format(colour)]
-
-            schedule = etree.Element('Schedule')
-            device = etree.SubElement(schedule, 'Device', name="FrodoSpec-{}".format(colour), type="spectrograph")
-            etree.SubElement(device, 'SpectralRegion').text = 'optical'
-            setup = etree.SubElement(device, 'Setup')
-            etree.SubElement(setup, 'Grating', name=res)
-            exposure = etree.SubElement(schedule, 'Exposure', count=count)
-            etree.SubElement(exposure, 'Value', units='seconds').text = time
-            schedule.append(self._build_target(target))
-            for const in self._build_constraints(constraints):
+        arms = (('Blue', observation.res_blue, observation.exp_count_blue, observation.exp_time_blue),
+                ('Red', observation.res_red, observation.exp_count_red, observation.exp_time_red))
+        for colour, res, exp_count, exp_time in arms:  # builds schedule for each colour arm of Frodo
+            schedule = _schedule_template('FrodoSpec-{}'.format(colour))
+            device, exposure = schedule
+            device[1][0].set('name', res)
+            exposure.set('count', str(exp_count))
+            exposure[0].text = _number(exp_time)
+            schedule.append(self._cached_target(observation.target, cache))
+            for const in self._cached_constraints(constraints, cache):
                 schedule.append(const)
             payload.append(schedule)
 
+    _SCHEDULE_BUILDERS = {
+        'IO:O': _build_inst_schedule_IOO,
+        'IO:I': _build_inst_schedule_IOI,
+        'Sprat': _build_inst_schedule_Sprat,
+        'Frodo': _build_inst_schedule_Frodo,
+        'Moptop': _build_inst_schedule_Moptop,
+    }
+
     def _build_target(self, target):
         """
         This provides the target info to the RTML file
         """
 
-        self.target = etree.Element('Target', name=target['name'])
-        coordinates = etree.SubElement(self.target, 'Coordinates')
-
-        ra_hour, ra_min, ra_sec = target['RA'].split(":")
-        dec_deg, dec_min, dec_sec = target['DEC'].split(":")
+        target_el = etree.Element('Target', name=target.name)
+        coordinates = etree.SubElement(target_el, 'Coordinates')
 
         ra = etree.SubElement(coordinates, 'RightAscension')
-        etree.SubElement(ra, 'Hours').text = ra_hour
-        etree.SubElement(ra, 'Minutes').text = ra_min
-        etree.SubElement(ra, 'Seconds').text = ra_sec
+        etree.SubElement(ra, 'Hours').text = '{0:02d}'.format(target.ra_h)
+        etree.SubElement(ra, 'Minutes').text = '{0:02d}'.format(target.ra_m)
+        etree.SubElement(ra, 'Seconds').text = _seconds(target.ra_s)
 
         dec = etree.SubElement(coordinates, 'Declination')
-        etree.SubElement(dec, 'Degrees').text = dec_deg
-        etree.SubElement(dec, 'Arcminutes').text = dec_min
-        etree.SubElement(dec, 'Arcseconds').text = dec_sec
+        etree.SubElement(dec, 'Degrees').text = '{0}{1:02d}'.format(target.dec_sign, target.dec_d)
+        etree.SubElement(dec, 'Arcminutes').text = '{0:02d}'.format(target.dec_m)
+        etree.SubElement(dec, 'Arcseconds').text = _seconds(target.dec_s)
         etree.SubElement(coordinates, 'Equinox').text = 'None'
-        return self.target
+        return target_el
+
+    def _cached_target(self, target, cache):
+        """
+        Returns a Target element for the schedule. With a group cache the element
+        is only built the first time a target is seen and copied after that
+        """
+        if cache is None:
+            return self._build_target(target)
+        if target not in cache:
+            cache[target] = self._build_target(target)
+        return copy.deepcopy(cache[target])
+
+    def _cached_constraints(self, constraints, cache):
+        """
+        Returns the Constraints elements for the schedule. With a group cache they
+        are only built the first time the constraints are seen and copied after that
+        """
+        if cache is None:
+            return self._build_constraints(constraints)
+        if constraints not in cache:
+            cache[constraints] = self._build_constraints(constraints)
+        return [copy.deepcopy(const) for const in cache[constraints]]
 
     def _build_constraints(self, constraints):
         """
         This adds the constrainsts of the observation to the Schedule
         """
-        if constraints['photometric'] == 'yes':
-            photometric = 'clear'
-        elif constraints['photometric'] == 'no':
-            photometric = 'light'
-        else:
-            print('Please chose yes or no for photometric')
-            exit()
         const = etree.Element('Constraints')
-        airmass_const = etree.SubElement(const, 'AirmassConstraint', maximum=str(constraints['air_mass']))
+        airmass_const = etree.SubElement(const, 'AirmassConstraint', maximum=_number(constraints.air_mass))
 
         sky_const = etree.SubElement(const, 'SkyConstraint')
-        etree.SubElement(sky_const, 'Flux').text = str(constraints['sky_bright'])
+        etree.SubElement(sky_const, 'Flux').text = _number(constraints.sky_bright)
         etree.SubElement(sky_const, 'Units').text = 'magnitudes/square-arcsecond'
 
         seeing_const = etree.SubElement(const, 'SeeingConstraint',
-                                        maximum=(str(constraints['seeing'])),
+                                        maximum=_number(constraints.seeing),
                                         units='arcseconds')
 
         photom_const = etree.SubElement(const, 'ExtinctionConstraint')
-        etree.SubElement(photom_const, 'Clouds').text = photometric
+        etree.SubElement(photom_const, 'Clouds').text = 'clear' if constraints.photometric else 'light'
 
         date_const = etree.SubElement(const, 'DateTimeConstraint', type='include')
-        start = constraints['start_date'] + 'T' + constraints['start_time'] + '+00:00'
-        end = constraints['end_date'] + 'T' + constraints['end_time'] + '+00:00'
+        start = constraints.start.isoformat() + '+00:00'
+        end = constraints.end.isoformat() + '+00:00'
         etree.SubElement(date_const, 'DateTimeStart', system='UT', value=start)
         etree.SubElement(date_const, 'DateTimeEnd', system='UT', value=end)
         return [airmass_const, sky_const, seeing_const, photom_const, date_const]
 
-    def submit_group(self, observations, constraints):
+    def build_group(self, observations, constraints, pretty_print=None):
         """
-        send the payload to the telescope and informs the user if it fails or is successful
+        Builds the RTML payload for a group without contacting the telescope.
+        observations and constraints may be the models (IOO, Sprat, ..., Constraints)
+        or the dicts shown in example.py, which are converted first.
+        Each schedule is written out as soon as it is built, giving compact XML,
+        unless pretty_print (by default settings['PRETTY_PRINT']) is True.
+        Returns the payload as UTF-8 bytes, ready for send_payload.
+        Raises ValueError if a value is missing or invalid or an instrument is not supported
         """
+        if pretty_print is None:
+            pretty_print = self.pretty_print
+        if not isinstance(constraints, Constraints):
+            constraints = Constraints.from_dict(constraints)
 
-        for k, v in constraints.items():
-            if v == '':
-                return ['fail', 'No value for ' + k]
+        if pretty_print:
+            with _timed(self.hooks, 'submit.build'):
+                payload = self._build_prolog()
+                self._build_schedules(observations, constraints, payload)
+            with _timed(self.hooks, 'submit.serialize'):
+                return etree.tostring(payload, encoding='UTF-8', xml_declaration=False, pretty_print=True)
 
-        payload = self._build_prolog()
-        self._build_project(payload)
+        # Streamed, so serializing happens during submit.build and is also timed on its own
+        with _timed(self.hooks, 'submit.build'):
+            root = self._build_prolog()
+            output = io.BytesIO()
+            with etree.xmlfile(output, encoding='UTF-8') as xf:
+                with xf.element(root.tag, root.attrib, nsmap=root.nsmap):
+                    streamed = _StreamedPayload(xf, timed=bool(self.hooks))
+                    self._build_schedules(observations, constraints, streamed)
+            payload = output.getvalue()
+        if streamed.seconds is not None:
+            for hook in self.hooks:
+                hook('submit.serialize', streamed.seconds)
+        return payload
 
+    def _build_schedules(self, observations, constraints, payload):
+        """
+        Adds the project and a schedule for each observation to payload, which is
+        either the RTML root element or a _StreamedPayload
+        """
+        self._build_project(payload)
+        cache = {}  # Target and Constraints elements shared by the schedules of this group
         for observation in observations:
-            observation['constraints'] = constraints
-            if observation['instrument'] == 'IO:O':
-                self._build_inst_schedule_IOO(observation, payload)
-            elif observation['instrument'] == 'IO:I':
-                self._build_inst_schedule_IOI(observation, payload)
-            elif observation['instrument'] == 'Sprat':
-                self._build_inst_schedule_Sprat(observation, payload)
-            elif observation['instrument'] == 'Frodo':
-                self._build_inst_schedule_Frodo(observation, payload)
-            elif observation['instrument'] =='Moptop':
-                self._build_inst_schedule_Moptop(observation, payload)
+            if not isinstance(observation, tuple(INSTRUMENTS.values())):
+                observation = observation_from_dict(observation)
+            builder = self._SCHEDULE_BUILDERS[observation.instrument]
+            builder(self, observation, constraints, payload, cache)
+
+    def send_payload(self, payload, force=False):
+        """
+        Sends a payload made by build_group to the telescope and records the uid if it is accepted.
+        With settings['DEDUP'] True, a group identical to one already accepted (within
+        settings['DEDUP_EXPIRY'] seconds) is not sent again and its uid is returned,
+        and a group identical to one still being sent, or which may have been accepted
+        when a reply was lost, fails, unless force is True.
+        Returns (uid, '') on success or ['fail', error] if it fails
+        """
+        if not self.settings.get('DEDUP', False):
+            return self._send_payload(payload)
+
+        with _timed(self.hooks, 'submit.dedup'):
+            uid, digest = _payload_key(payload)
+            if force:
+                found = None
             else:
-                return ['fail', 'Instrument ' + observation['instrument'] + ' not supported']
+                found = self.ledger.reserve(uid, digest, self.settings.get('DEDUP_EXPIRY', 86400),
+                                            self.settings.get('DEDUP_PENDING', 300))
+        if found is not None:
+            other, status = found
+            if status == 'confirm':
+                return (other, '')
+            if status == 'unknown':
+                return ['fail', 'An identical group, ' + other + ', may have been accepted already. '
+                                'Check it and use force=True to send this one']
+            return ['fail', 'An identical group, ' + other + ', is still being sent']
+        try:
+            return self._send_payload(payload, uid, digest)
+        finally:
+            # Drops the reservation if the group was not sent or was rejected.
+            # An accepted group is 'confirm' and one which may have been accepted 'unknown'
+            self.ledger.release(uid)
 
-        full_payload = etree.tostring(payload, encoding="unicode", pretty_print=True)
-        headers = {
-            'Username': self.settings['username'],
-            'Password': self.settings['rtmlpass']
-        }
-        url = '{0}://{1}:{2}/node_agent2/node_agent?wsdl'.format('http', self.settings['LT_HOST'], self.settings['LT_PORT'])
-        client = Client(url=url, headers=headers)
+    def _send_payload(self, payload, uid=None, digest=None):
+        """
+        Validates and sends a payload and records its uid if it is accepted.
+        uid and digest are the payload's uid and payload_hash when they are
+        already known. With a digest, a group which may have been accepted
+        is recorded as 'unknown' so it is not sent again by accident
+        """
+        if self.validator is not None:
+            with _timed(self.hooks, 'submit.validate'):
+                errors = self.validator.validate(payload)
+            if errors:
+                return ['fail', 'Payload failed schema validation: ' + '; '.join(errors)]
+
+        # suds only marshals a str for the document (bytes are sent as their repr)
+        # and builds the whole SOAP envelope as a str, so this copy cannot be avoided
+        full_payload = payload.decode('UTF-8')
         try:
-            # Send payload, and receive response string, removing the encoding tag which causes issue with lxml parsing
-            response = client.service.handle_rtml(full_payload).replace('encoding="ISO-8859-1"', '')
+            with _timed(self.hooks, 'submit.send'):
+                response = self.session.handle_rtml(full_payload, headers=self.headers)
         except suds.WebFault:
             return ['fail', 'Error with connection to telescope']
+        except LTTransportError as e:
+            if e.sent is None:
+                if uid is None:
+                    uid = etree.fromstring(payload).get('uid')
+                if digest is not None:
+                    self.ledger.add(uid, digest, status='unknown')
+                return ['fail', 'No reply from telescope, group ' + uid + ' may have been accepted: ' + str(e)]
+            return ['fail', str(e)]
 
-        response_rtml = etree.fromstring(response)
-        mode = response_rtml.get('mode')
-        uid = response_rtml.get('uid')
-        if self.settings['DEBUG'] is True:
-            f = open(uid + '.RTML', "w")
-            f.write(full_payload)
-            f.write(response)
-            f.close()
-        if mode == 'reject':
-            return ['fail', 'This submission has been rejected']
-        elif mode == 'confirm':
-            if os.path.exists(self.pickle):
-                with open(self.pickle, "rb") as rp:
-                    uids = pickle.load(rp)
-            else:
-                uids = []
-            uids.append(uid)
-            with open(self.pickle, "wb") as wp:
-                pickle.dump(uids, wp)
+        with _timed(self.hooks, 'submit.parse'):
+            reply = decode_response(response)
+            uid = reply.uid
+        if self.debug is not None:
+            with _timed(self.hooks, 'submit.debug'):
+                self.debug.record('submit', uid, full_payload, response)
+        if reply.mode == 'reject':
+            return LTRejection(['fail', 'This submission has been rejected' + _rejection_reasons(reply)], reply)
+        elif reply.mode == 'confirm':
+            with _timed(self.hooks, 'submit.ledger'):
+                self.ledger.add(uid, digest)
         return (uid, '')
 
+    def submit_group(self, observations, constraints, force=False):
+        """
+        send the payload to the telescope and informs the user if it fails or is successful.
+        With settings['DEDUP'] a group identical to one already accepted is not sent again unless force is True
+        """
+        with _timed(self.hooks, 'submit'):
+            try:
+                payload = self.build_group(observations, constraints)
+            except ValueError as e:
+                return ['fail', str(e)]
+            return self.send_payload(payload, force)
+
+    def submit_groups(self, groups, max_workers=None, max_rps=None, force=False):
+        """
+        Sends several groups to the telescope concurrently. Each group is an
+        (observations, constraints) pair and groups may come from a generator.
+        At most max_workers submissions are in flight at once and no more than
+        max_rps are started per second. force is passed on to submit_group.
+        Returns the submit_group result for each group, in the order given
+        """
+        if max_workers is None:
+            max_workers = self.settings.get('MAX_WORKERS', 4)
+        if max_rps is None:
+            max_rps = self.settings.get('MAX_RPS', 0)
+        limiter = _RateLimiter(max_rps)
+
+        def send(group):
+            limiter.wait()
+            try:
+                return self.submit_group(*group, force=force)
+            except Exception as e:
+                return ['fail', str(e)]
+
+        return list(_bounded_map(send, groups, max_workers))
+
     def get_uids(self):
         """
-        Returns a tuple of uids submitted to the telescope
+        Returns a list of uids submitted to the telescope
         """
-        with open(self.pickle, "rb") as uids:
-            uids = pickle.load(uids)
-            return uids
+        return self.ledger.uids()
+
+    def _send_cancel(self, uid):
+        """
+        Sends the abort RTML for a single uid without touching the uid store.
+        Returns the error list and the uid confirmed as cancelled (None otherwise)
+        """
+        with _timed(self.hooks, 'cancel.build'):
+            LT_XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+            LT_SCHEMA_LOCATION = 'http://www.rtml.org/v3.1a http://telescope.livjm.ac.uk/rtml/RTML-nightly.xsd'
+
+            namespaces = {
+                'xsi': LT_XSI_NS,
+            }
+            schemaLocation = etree.QName(LT_XSI_NS, 'schemaLocation')
+            cancel_payload = etree.Element('RTML',
+                                           {schemaLocation: LT_SCHEMA_LOCATION},
+                                           mode='abort',
+                                           uid=uid,
+                                           version='3.1a',
+                                           nsmap=namespaces
+                                           )
+            project = etree.SubElement(cancel_payload, 'Project', ProjectID=self.settings['proposal'])
+            contact = etree.SubElement(project, 'Contact')
+            etree.SubElement(contact, 'Username').text = self.settings['username']
+            etree.SubElement(contact, 'Name').text = ''
+            etree.SubElement(contact, 'Communication')
+            cancel = etree.tostring(cancel_payload, encoding='unicode', pretty_print=self.pretty_print)
+
+        try:
+            with _timed(self.hooks, 'cancel.send'):
+                response = self.session.handle_rtml(cancel, idempotent=True, headers=self.headers)
+        except suds.WebFault:
+            return ['Error with connection to telescope'], None
+        except LTTransportError as e:
+            return [str(e)], None
+        with _timed(self.hooks, 'cancel.parse'):
+            reply = decode_response(response)
+            uid = reply.uid
+        if self.debug is not None:
+            with _timed(self.hooks, 'cancel.debug'):
+                self.debug.record('cancel', uid, cancel, response)
+        if reply.mode == 'reject':
+            return LTRejection(['Cancel Failed for ' + uid + _rejection_reasons(reply)], reply), None
+        elif reply.mode == 'confirm':
+            return [], uid
+        return None, None
 
     def cancel_group(self, uid):
         """
         Deletes observation with known uid from the telescope.
         """
-        LT_XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
-        LT_SCHEMA_LOCATION = 'http://www.rtml.org/v3.1a http://telescope.livjm.ac.uk/rtml/RTML-nightly.xsd'
+        with _timed(self.hooks, 'cancel'):
+            errors, cancelled = self._send_cancel(uid)
+            if cancelled is not None:
+                with _timed(self.hooks, 'cancel.ledger'):
+                    self.ledger.remove([cancelled])
+            return errors
 
-        namespaces = {
-            'xsi': LT_XSI_NS,
-        }
-        schemaLocation = etree.QName(LT_XSI_NS, 'schemaLocation')
-        cancel_payload = etree.Element('RTML',
-                                       {schemaLocation: LT_SCHEMA_LOCATION},
-                                       mode='abort',
-                                       uid=uid,
-                                       version='3.1a',
-                                       nsmap=namespaces
-                                       )
-        project = etree.SubElement(cancel_payload, 'Project', ProjectID=self.settings['proposal'])
-        contact = etree.SubElement(project, 'Contact')
-        etree.SubElement(contact, 'Username').text = self.settings['username']
-        etree.SubElement(contact, 'Name').text = ''
-        etree.SubElement(contact, 'Communication')
-        cancel = etree.tostring(cancel_payload, encoding='unicode', pretty_print=True)
+    def cancel_groups(self, uids, max_workers=None, max_rps=None):
+        """
+        Deletes several observation groups from the telescope concurrently.
+        All confirmed cancellations are removed from the uid store in one write.
+        Returns a dict of uid to the error list cancel_group would have given
+        """
+        if max_workers is None:
+            max_workers = self.settings.get('MAX_WORKERS', 4)
+        if max_rps is None:
+            max_rps = self.settings.get('MAX_RPS', 0)
+        limiter = _RateLimiter(max_rps)
 
-        headers = {
-            'Username': self.settings['username'],
-            'Password': self.settings['rtmlpass']
-        }
-        url = '{0}://{1}:{2}/node_agent2/node_agent?wsdl'.format('http',
-                                                                 self.settings['LT_HOST'], self.settings['LT_PORT'])
+        def send(uid):
+            limiter.wait()
+            try:
+                return self._send_cancel(uid)
+            except Exception as e:
+                return [str(e)], None
+
+        uids = list(uids)
+        replies = list(_bounded_map(send, uids, max_workers))
+        with _timed(self.hooks, 'cancel.ledger'):
+            self.ledger.remove([cancelled for errors, cancelled in replies if cancelled is not None])
+        return {uid: errors for uid, (errors, cancelled) in zip(uids, replies)}
+
+
+class LTManager():
+    """
+    Sends groups for several proposals from one process. Proposals on the same
+    LT_HOST and LT_PORT share one LTSession, so the WSDL, clients and circuit breaker
+    are shared while each call carries its own proposal's credentials. The uids of
+    every proposal are kept in one LTLedger store, each under its proposal's name.
+    Calls are run by a fair scheduler taking one call from each proposal in turn
+    """
+
+    def __init__(self, proposals, store, max_workers=4, max_rps=0, policy=None):
+        """
+        proposals is a list of settings dicts as given to LTObs, one per proposal.
+        The uids are kept in store + '.db', and any kept in a proposal's own
+        PKLFILE store are moved there, under its name, when it is added.
+        max_workers calls are run at once and no more than max_rps are started
+        each second across all proposals. policy is used for every session,
+        by default each is made from the settings of its first proposal
+        """
+        self.hooks = []
+        self.ledger = LTLedger(store)
+        self.sessions = {}
+        self.proposals = {}
+        self._policy = policy
+        self._debug_archives = {}
+        self._scheduler = _FairScheduler(max_workers, max_rps)
+        for settings in proposals:
+            self.add_proposal(settings)
+
+    def add_proposal(self, settings):
+        """
+        Adds a proposal from its settings dict and returns its LTObs object
+        """
+        name = settings['proposal']
+        if name in self.proposals:
+            raise ValueError('Proposal ' + name + ' already added')
+        key = (settings['LT_HOST'], str(settings['LT_PORT']))
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = LTSession(settings, self._policy)
+            session.hooks = self.hooks
+        ledger = self.ledger.scoped(name)
+        if settings.get('PKLFILE'):
+            ledger.adopt(settings['PKLFILE'])
+        obs = LTObs(settings, session=session, ledger=ledger)
+        if obs.debug is not None:
+            # One archive, and writer thread, for each debug directory
+            obs.debug = self._debug_archives.setdefault(obs.debug.directory, obs.debug)
+        self.proposals[name] = obs
+        return obs
+
+    def __getitem__(self, proposal):
+        """
+        Returns the LTObs object of a proposal
+        """
+        return self.proposals[proposal]
+
+    def add_hook(self, hook):
+        """
+        Registers hook(phase, seconds) for the calls of every proposal, e.g. an LTMetrics object
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Stops calling a hook registered with add_hook
+        """
+        self.hooks.remove(hook)
+
+    def submit(self, proposal, observations, constraints, force=False):
+        """
+        Queues a group for a proposal. Returns a Future for the submit_group result
+        """
+        obs = self.proposals[proposal]
+        return self._scheduler.submit(proposal, obs.submit_group, observations, constraints, force)
+
+    def cancel(self, proposal, uid):
+        """
+        Queues the cancel of a proposal's group. Returns a Future for the cancel_group result
+        """
+        obs = self.proposals[proposal]
+        return self._scheduler.submit(proposal, obs.cancel_group, uid)
+
+    def submit_groups(self, groups, force=False):
+        """
+        Sends several groups, each a (proposal, observations, constraints) tuple.
+        Returns the submit_group result for each group, in the order given
+        """
+        futures = [self.submit(proposal, observations, constraints, force)
+                   for proposal, observations, constraints in groups]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(['fail', str(e)])
+        return results
+
+    def pending(self):
+        """
+        Returns the number of queued calls waiting for each proposal
+        """
+        return self._scheduler.pending()
+
+    def close(self):
+        """
+        Finishes the queued calls and stops the scheduler
+        """
+        self._scheduler.close()
+
+
+def read_targets(source, delimiter=None, name='name', ra='RA', dec='DEC'):
+    """
+    Lazily reads targets from a catalogue, yielding one target dict per row.
+    source is a CSV/TSV file path, an open text file or a NumPy structured array.
+    The name, ra and dec arguments give the column names to use for the target
+    'name', 'RA' and 'DEC', all other columns are passed through unchanged.
+    The delimiter is taken from the file extension ('.tsv' for tabs) unless given
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if delimiter is None:
+            delimiter = '\t' if str(source).endswith('.tsv') else ','
+        with open(source, newline='') as catalog:
+            yield from read_targets(catalog, delimiter, name, ra, dec)
+        return
+
+    if getattr(getattr(source, 'dtype', None), 'names', None):
+        columns = source.dtype.names
+        rows = ({column: _catalog_value(row[column]) for column in columns} for row in source)
+    else:
+        rows = csv.DictReader(source, delimiter=delimiter or ',')
+
+    for row in rows:
+        target = dict(row)
+        target['name'] = row[name]
+        target['RA'] = row[ra]
+        target['DEC'] = row[dec]
+        yield target
+
+
+def _catalog_value(value):
+    """
+    Converts a NumPy catalogue value to a plain Python value for the target dict.
+    Text becomes str and numbers, such as decimal degree coordinates, stay numbers
+    """
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, str):
+        return str(value)
+    return value.item() if hasattr(value, 'item') else value
+
+
+def catalog_groups(targets, template, constraints, group_size=1):
+    """
+    Turns a stream of targets into (observations, constraints) groups for
+    submit_group, submit_groups or build_group, without reading ahead.
+    template is an observation dict, a list of them, or a function taking the
+    target and returning a list of observations. group_size targets go in each group
+    """
+    targets = iter(targets)
+    while True:
+        chunk = list(itertools.islice(targets, group_size))
+        if not chunk:
+            return
+        observations = []
+        for target in chunk:
+            if callable(template):
+                observations.extend(template(target))
+            elif isinstance(template, dict):
+                observations.append(dict(template, target=target))
+            else:
+                observations.extend(dict(observation, target=target) for observation in template)
+        yield observations, constraints
+
+
+Coordinates = namedtuple('Coordinates', ['ra', 'dec', 'ra_deg', 'dec_deg',
+                                         'ra_h', 'ra_m', 'ra_s',
+                                         'dec_sign', 'dec_d', 'dec_m', 'dec_s',
+                                         'error'])
+
+
+def _drop_first(values):
+    """
+    Returns an array of strings with the first character of each removed
+    """
+    import numpy as np
+    width = values.dtype.itemsize // np.dtype('U1').itemsize
+    if width <= 1:
+        return np.zeros(values.shape, dtype='U1')
+    chars = np.ascontiguousarray(values).view('U1').reshape(values.shape + (width,))
+    return np.ascontiguousarray(chars[..., 1:]).view('U{0}'.format(width - 1)).reshape(values.shape)
+
+
+def _split_sexagesimal(values, signed):
+    """
+    Splits an array of 'XX:MM:SS.SS' strings into sign, whole, minutes and seconds
+    string arrays, plus a mask of the rows whose fields are well formed
+    """
+    import numpy as np
+    sign = values.astype('U1')
+    has_sign = (sign == '+') | (sign == '-')
+    if signed:
+        values = np.where(has_sign, _drop_first(values), values)
+    whole, _, rest = np.moveaxis(np.char.partition(values, ':'), -1, 0)
+    minutes, _, seconds = np.moveaxis(np.char.partition(rest, ':'), -1, 0)
+    sec_int, _, sec_frac = np.moveaxis(np.char.partition(seconds, '.'), -1, 0)
+    ok = (np.char.count(values, ':') == 2) & (has_sign if signed else ~has_sign)
+    for field, min_width in ((whole, 1), (minutes, 2), (sec_int, 2)):
+        length = np.char.str_len(field)
+        ok &= np.char.isdigit(field) & (length >= min_width) & (length <= 2)
+    ok &= (sec_frac == '') | np.char.isdigit(sec_frac)
+    return sign, whole, minutes, seconds, ok
+
+
+def _decimal_mask(values):
+    """
+    Returns a mask of the rows which are plain decimal numbers, e.g. '-12.5'
+    """
+    import numpy as np
+    digits = np.char.replace(np.char.lstrip(values, '+-'), '.', '', count=1)
+    signs = np.char.str_len(values) - np.char.str_len(np.char.lstrip(values, '+-'))
+    return np.char.isdigit(digits) & (signs <= 1)
+
+
+def parse_coordinates(ra, dec):
+    """
+    Parses and validates arrays of RA and DEC in a single vectorised pass (needs NumPy).
+    RA may be 'HH:MM:SS.SS' or decimal degrees, DEC '+/-DD:MM:SS.SS' or decimal degrees.
+    Returns a Coordinates tuple of arrays with the normalised 'HH:MM:SS.SSS' and
+    '+DD:MM:SS.SS' strings, the positions in degrees, their components and an error
+    mask which is True for each row that is badly formatted or out of range
+    """
+    import numpy as np
+    ra = np.char.strip(np.atleast_1d(np.asarray(ra, dtype=str)))
+    dec = np.char.strip(np.atleast_1d(np.asarray(dec, dtype=str)))
+    if ra.size == 0 or dec.size == 0:
+        empty = np.zeros(0)
+        return Coordinates(np.zeros(0, dtype=str), np.zeros(0, dtype=str), empty, empty,
+                           np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), empty,
+                           np.zeros(0, dtype=str), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                           empty, np.zeros(0, dtype=bool))
+
+    _, ra_h, ra_m, ra_s, ra_sex = _split_sexagesimal(ra, signed=False)
+    dec_sign, dec_d, dec_m, dec_s, dec_sex = _split_sexagesimal(dec, signed=True)
+    ra_dec_mask = ~ra_sex & _decimal_mask(ra)
+    dec_dec_mask = ~dec_sex & _decimal_mask(dec)
 
-        client = Client(url=url, headers=headers)
-        # Send cancel_payload, and receive response string, removing the encoding tag which causes issue with lxml parsing
+    def number(values, mask):
+        return np.where(mask, values, '0').astype(float)
+
+    h, m, s = number(ra_h, ra_sex), number(ra_m, ra_sex), number(ra_s, ra_sex)
+    ra_ok = ra_sex & (h < 24) & (m < 60) & (s < 60)
+    ra_deg = np.where(ra_sex, (h + m / 60 + s / 3600) * 15, number(ra, ra_dec_mask))
+    ra_ok |= ra_dec_mask & (ra_deg >= 0) & (ra_deg < 360)
+
+    d, m, s = number(dec_d, dec_sex), number(dec_m, dec_sex), number(dec_s, dec_sex)
+    dec_abs = d + m / 60 + s / 3600
+    dec_ok = dec_sex & (m < 60) & (s < 60) & (dec_abs <= 90)
+    dec_deg = np.where(dec_sex, np.where(dec_sign == '-', -dec_abs, dec_abs), number(dec, dec_dec_mask))
+    dec_ok |= dec_dec_mask & (np.abs(dec_deg) <= 90)
+
+    error = ~(ra_ok & dec_ok)
+    ra_deg = np.where(error, np.nan, ra_deg)
+    dec_deg = np.where(error, np.nan, dec_deg)
+
+    # Normalised components, rounded to milliseconds of time and centi-arcseconds
+    ms = np.where(error, 0, np.rint(ra_deg * 240000)).astype(np.int64) % 86400000
+    ra_h, ra_m, ra_s = ms // 3600000, ms // 60000 % 60, ms % 60000 / 1000
+    cas = np.where(error, 0, np.rint(np.abs(dec_deg) * 360000)).astype(np.int64)
+    dec_sign = np.where(np.signbit(dec_deg) & (cas > 0), '-', '+')
+    dec_d, dec_m, dec_s = cas // 360000, cas // 6000 % 60, cas % 6000 / 100
+
+    def join(*parts):
+        joined = parts[0]
+        for part in parts[1:]:
+            joined = np.char.add(np.char.add(joined, ':'), part)
+        return joined
+
+    ra_str = join(np.char.mod('%02d', ra_h), np.char.mod('%02d', ra_m), np.char.mod('%06.3f', ra_s))
+    dec_str = np.char.add(dec_sign, join(np.char.mod('%02d', dec_d), np.char.mod('%02d', dec_m),
+                                         np.char.mod('%05.2f', dec_s)))
+    ra_str = np.where(error, '', ra_str)
+    dec_str = np.where(error, '', dec_str)
+    return Coordinates(ra_str, dec_str, ra_deg, dec_deg,
+                       ra_h, ra_m, ra_s, dec_sign, dec_d, dec_m, dec_s, error)
+
+
+def _run_job(obs, job):
+    """
+    Carries out one daemon job and returns the result dict to send back
+    """
+    op = job.get('op', 'submit')
+    result = {'id': job.get('id'), 'op': op}
+    if op == 'submit':
+        reply = obs.submit_group(job['observations'], job['constraints'], job.get('force', False))
+        if reply[0] == 'fail':
+            result.update(ok=False, error=reply[1])
+            if isinstance(reply, LTRejection):
+                result.update(reasons=list(reply.response.errors))
+        else:
+            result.update(ok=True, uid=reply[0])
+    elif op == 'cancel':
+        uids = job['uids'] if 'uids' in job else [job['uid']]
+        errors = obs.cancel_groups(uids)
+        result.update(ok=all(error == [] for error in errors.values()), errors=errors)
+        reasons = {uid: list(error.response.errors) for uid, error in errors.items() if isinstance(error, LTRejection)}
+        if reasons:
+            result.update(reasons=reasons)
+    elif op == 'uids':
+        result.update(ok=True, uids=obs.get_uids())
+    elif op == 'metrics':
+        metrics = [hook for hook in obs.hooks if isinstance(hook, LTMetrics)]
+        result.update(ok=True, metrics=metrics[0].summary() if metrics else {})
+    else:
+        result.update(ok=False, error='Unknown op ' + str(op))
+    return result
+
+
+def _serve_lines(obs, lines, write, pool, limit):
+    """
+    Runs the JSONL jobs read from lines on the pool, calling write with each
+    JSONL result as it completes. No more than limit jobs are read ahead of
+    those finished. Returns once every job has finished
+    """
+    lock = threading.Lock()
+    slots = threading.Semaphore(limit)
+
+    def run(line):
         try:
-            response = client.service.handle_rtml(cancel).replace('encoding="ISO-8859-1"', '')
-        except suds.WebFault:
-            return ['Error with connection to telescope']
-        response_rtml = etree.fromstring(response)
-        mode = response_rtml.get('mode')
-        uid = response_rtml.get('uid')
-        if self.settings['DEBUG']:
-            f = open(uid + '_cancel.RTML', "w")
-            f.write(cancel)
-            f.write(response)
-            f.close()
-        if mode == 'reject':
-            return ['Cancel Failed for ' + uid]
-        elif mode == 'confirm':
-            with open(self.pickle, "rb") as rp:
-                all_uids = pickle.load(rp)
-            if uid in all_uids:
-                all_uids.remove(uid)
-                with open(self.pickle, "wb") as cancelled:
-                    pickle.dump(all_uids, cancelled)
-            return []
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                result = {'id': None, 'ok': False, 'error': 'Bad job: ' + str(e)}
+            else:
+                if not isinstance(job, dict):
+                    result = {'id': None, 'ok': False, 'error': 'Bad job: not a JSON object'}
+                else:
+                    try:
+                        result = _run_job(obs, job)
+                    except Exception as e:
+                        result = {'id': job.get('id'), 'op': job.get('op', 'submit'), 'ok': False, 'error': repr(e)}
+            try:
+                text = json.dumps(result)
+            except (TypeError, ValueError) as e:
+                # e.g. an id that cannot be written back as JSON
+                text = json.dumps({'id': None, 'ok': False, 'error': 'Bad result: ' + str(e)})
+            with lock:
+                write(text + '\n')
+        finally:
+            slots.release()
+
+    for line in lines:
+        if line.strip():
+            slots.acquire()
+            pool.submit(run, line)
+    for _ in range(limit):
+        slots.acquire()
+
+
+def main(argv=None):
+    """
+    Command line entry point, run as python -m ltrtml --settings settings.json <command>.
+    The daemon command keeps one LTObs open and reads JSONL jobs from stdin,
+    or from clients of a unix socket with --socket, writing one JSONL result per job
+    """
+    parser = argparse.ArgumentParser(prog='ltrtml', description='Send observation groups to the Liverpool Telescope')
+    parser.add_argument('--settings', required=True, help='JSON file holding the settings dictionary')
+    commands = parser.add_subparsers(dest='command', required=True)
+    daemon = commands.add_parser('daemon', help='process JSONL jobs from stdin or a unix socket')
+    daemon.add_argument('--socket', help='listen on this unix socket path instead of stdin')
+    commands.add_parser('uids', help='list the uids of submitted groups')
+    args = parser.parse_args(argv)
+
+    with open(args.settings) as f:
+        settings = json.load(f)
+    obs = LTObs(settings)
+
+    if args.command == 'uids':
+        for uid in obs.get_uids():
+            print(uid)
+        return
+
+    obs.add_hook(LTMetrics())
+    max_workers = settings.get('MAX_WORKERS', 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if args.socket is None:
+            def write(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            _serve_lines(obs, sys.stdin, write, pool, 2 * max_workers)
+            return
+
+        class JobHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                def write(text):
+                    self.wfile.write(text.encode('UTF-8'))
+                    self.wfile.flush()
+                lines = (line.decode('UTF-8') for line in self.rfile)
+                _serve_lines(obs, lines, write, pool, 2 * max_workers)
+
+        if os.path.exists(args.socket):
+            if not stat.S_ISSOCK(os.stat(args.socket).st_mode):
+                parser.error(args.socket + ' exists and is not a socket')
+            os.remove(args.socket)
+        server = socketserver.ThreadingUnixStreamServer(args.socket, JobHandler)
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Shared fixtures. The tests talk to the mock node agent from benchmarks/ over a
+local port, so no connection to the telescope is made
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import mock_node_agent  # noqa: E402
+
+TARGET = {
+    'name': 'Vega',
+    'RA': '18:36:56.336',
+    'DEC': '+38:47:01.280',
+}
+
+CONSTRAINTS = {
+    'air_mass': '2.0',
+    'sky_bright': '2.0',
+    'seeing': '1.2',
+    'photometric': 'yes',
+    'start_date': '2020-02-18',
+    'start_time': '18:00:00.00',
+    'end_date': '2020-02-28',
+    'end_time': '00:00:00.00',
+}
+
+OBSERVATION = {'instrument': 'IO:I', 'target': TARGET, 'exp_time': '120.0', 'exp_count': '5'}
+
+
+class FailingHandler(mock_node_agent.NodeAgentHandler):
+    """
+    Replies to handle_rtml calls with the HTTP status codes queued on the
+    server's failures list, one per call, before answering normally again
+    """
+
+    def do_POST(self):
+        with self.server._lock:
+            code = self.server.failures.pop(0) if self.server.failures else None
+        if code is None:
+            return mock_node_agent.NodeAgentHandler.do_POST(self)
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.count(code)
+        self.send_error(code)
+
+
+@pytest.fixture
+def node_agent():
+    """
+    A running mock node agent. Append status codes to node_agent.failures
+    to make the next calls fail
+    """
+    server = mock_node_agent.MockNodeAgent()
+    server.RequestHandlerClass = FailingHandler
+    server.failures = []
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def settings(tmp_path, node_agent):
+    return {
+        'username': 'user',
+        'rtmlpass': 'pass',
+        'proposal': 'proposal',
+        'prefix': 'test',
+        'LT_HOST': 'localhost',
+        'LT_PORT': str(node_agent.port),
+        'PKLFILE': str(tmp_path / 'uids'),
+        'DEBUG': False,
+        'WSDL_CACHE': str(tmp_path / 'wsdl'),
+        'RETRIES': 2,
+        'BACKOFF': 0.01,
+    }
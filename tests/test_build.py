@@ -0,0 +1,49 @@
+import sys
+import threading
+
+from lxml import etree
+
+import ltrtml
+from conftest import CONSTRAINTS
+
+RTML = '{http://www.rtml.org/v3.1a}'
+
+
+def coordinates(target):
+    """
+    Returns the RA and DEC text of a built Target element as 'HH:MM:SS' strings
+    """
+    ra = target.find(RTML + 'Coordinates/' + RTML + 'RightAscension')
+    dec = target.find(RTML + 'Coordinates/' + RTML + 'Declination')
+    return (':'.join(element.text for element in ra), ':'.join(element.text for element in dec))
+
+
+def test_targets_built_concurrently(settings):
+    # Switch threads as often as possible so a shared builder state would be overwritten
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    obs = ltrtml.LTObs(settings)
+    targets = [{'name': 'T{0}'.format(n), 'RA': '{0:02d}:{1:02d}:01.5'.format(n, n), 'DEC': '+{0:02d}:{1:02d}:02.5'.format(n, n)}
+               for n in range(8)]
+    bad = []
+
+    def build(target):
+        observation = {'instrument': 'IO:O', 'target': target, 'binning': '2',
+                       'filters': {'R': {'exp_time': '60', 'exp_count': '1'},
+                                   'V': {'exp_time': '60', 'exp_count': '1'}}}
+        expected = ('{0}:{1}:01.5'.format(target['RA'][:2], target['RA'][3:5]), target['DEC'][:6] + ':02.5')
+        for _ in range(200):
+            payload = etree.fromstring(obs.build_group([observation], CONSTRAINTS))
+            for element in payload.iter(RTML + 'Target'):
+                if element.get('name') != target['name'] or coordinates(element) != expected:
+                    bad.append(etree.tostring(element))
+
+    threads = [threading.Thread(target=build, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert bad == []
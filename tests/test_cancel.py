@@ -0,0 +1,39 @@
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION
+
+
+def submitted(obs, count):
+    results = obs.submit_groups([([OBSERVATION], CONSTRAINTS)] * count)
+    assert all(error == '' for uid, error in results)
+    return [uid for uid, error in results]
+
+
+def test_cancel_groups_writes_the_ledger_once(settings, node_agent, monkeypatch):
+    obs = ltrtml.LTObs(settings)
+    uids = submitted(obs, 6)
+    removes = []
+    remove = obs.ledger.remove
+    monkeypatch.setattr(obs.ledger, 'remove', lambda cancelled: removes.append(list(cancelled)) or remove(cancelled))
+    errors = obs.cancel_groups(uids[:4])
+    assert errors == {uid: [] for uid in uids[:4]}
+    assert len(removes) == 1
+    assert sorted(removes[0]) == sorted(uids[:4])
+    assert sorted(obs.get_uids()) == sorted(uids[4:])
+    assert node_agent.counts['abort'] == 4
+
+
+def test_failed_cancels_stay_in_the_ledger(settings, node_agent):
+    obs = ltrtml.LTObs(dict(settings, RETRIES=0))
+    uids = submitted(obs, 3)
+    node_agent.failures.append(400)
+    errors = obs.cancel_groups(uids, max_workers=1)
+    assert errors[uids[0]] != []
+    assert errors[uids[1]] == errors[uids[2]] == []
+    assert obs.get_uids() == [uids[0]]
+
+
+def test_cancel_group(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    first, second = submitted(obs, 2)
+    assert obs.cancel_group(first) == []
+    assert obs.get_uids() == [second]
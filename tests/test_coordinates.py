@@ -0,0 +1,49 @@
+import pytest
+
+import ltrtml
+
+np = pytest.importorskip('numpy')
+
+
+def test_sexagesimal_and_decimal_degrees():
+    coords = ltrtml.parse_coordinates(['18:36:56.336', '279.2347', '10:00:00'],
+                                      ['+38:47:01.28', '38.7837', '-05:30:00'])
+    assert not coords.error.any()
+    assert list(coords.ra) == ['18:36:56.336', '18:36:56.328', '10:00:00.000']
+    assert list(coords.dec) == ['+38:47:01.28', '+38:47:01.32', '-05:30:00.00']
+    assert coords.ra_deg[2] == 150
+    assert coords.dec_deg[2] == -5.5
+    assert list(coords.dec_sign) == ['+', '+', '-']
+
+
+@pytest.mark.parametrize('ra, dec', [
+    ('24:00:00', '+00:00:00'),    # RA hours out of range
+    ('12:60:00', '+00:00:00'),    # RA minutes out of range
+    ('1:2:3', '+01:02:03'),       # Fields too short
+    ('10:00:00', '--10:00:00'),   # Doubled sign
+    ('10:00:00', '-90:00:01'),    # DEC beyond the pole
+    ('360', '0'),                 # RA degrees out of range
+    ('ten', '+10:00:00'),
+])
+def test_bad_rows_are_flagged(ra, dec):
+    coords = ltrtml.parse_coordinates([ra, '10:00:00'], [dec, '+10:00:00'])
+    assert list(coords.error) == [True, False]
+    assert np.isnan(coords.ra_deg[0])
+
+
+def test_agrees_with_target_parse():
+    ra = ['00:00:00.5', '23:59:59.9', '12:34:56.789', '187.5']
+    dec = ['-89:59:59.9', '+00:00:00', '-00:30:00', '-12.25']
+    coords = ltrtml.parse_coordinates(ra, dec)
+    for row, (r, d) in enumerate(zip(ra, dec)):
+        target = ltrtml.Target.parse('t', r, d)
+        assert (coords.ra_h[row], coords.ra_m[row]) == (target.ra_h, target.ra_m)
+        assert coords.ra_s[row] == pytest.approx(target.ra_s, abs=1e-3)
+        assert (coords.dec_sign[row], coords.dec_d[row], coords.dec_m[row]) == (target.dec_sign, target.dec_d, target.dec_m)
+        assert coords.dec_s[row] == pytest.approx(target.dec_s, abs=1e-2)
+
+
+def test_empty_and_scalar_input():
+    empty = ltrtml.parse_coordinates([], [])
+    assert len(empty.ra) == len(empty.error) == 0
+    assert list(ltrtml.parse_coordinates('18:36:56.336', '-05:00:00').error) == [False]
@@ -0,0 +1,85 @@
+import json
+import socket
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION, ROOT
+
+
+def serve(obs, lines):
+    output = []
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        ltrtml._serve_lines(obs, lines, output.append, pool, 4)
+    return [json.loads(text) for text in output]
+
+
+def test_every_line_is_answered(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    lines = ['{"id": 1, "op": "submit", "observations": [], "constraints": {}}\n',
+             'not json\n',
+             '[1, 2]\n',
+             '\n',
+             json.dumps({'id': 2, 'observations': [OBSERVATION], 'constraints': CONSTRAINTS}) + '\n',
+             '{"id": 3, "op": "sideways"}\n',
+             '{"id": 4, "op": "uids"}\n']
+    results = serve(obs, lines)
+    assert len(results) == 6
+    by_id = {result['id']: result for result in results if result['id'] is not None}
+    assert by_id[1]['ok'] is False
+    assert by_id[2]['ok'] is True
+    assert by_id[3] == {'id': 3, 'op': 'sideways', 'ok': False, 'error': 'Unknown op sideways'}
+    assert by_id[4]['ok'] is True
+    bad = [result for result in results if result['id'] is None]
+    assert len(bad) == 2
+    assert all(result['error'].startswith('Bad job') for result in bad)
+
+
+def test_rejection_reasons(settings, node_agent):
+    node_agent.reject_rate = 1.0
+    node_agent.reject_body = '<Error>No such filter</Error>'
+    obs = ltrtml.LTObs(settings)
+    job = {'id': 'a', 'observations': [OBSERVATION], 'constraints': CONSTRAINTS}
+    [result] = serve(obs, [json.dumps(job)])
+    assert result['ok'] is False
+    assert result['reasons'] == ['No such filter']
+
+
+def test_cancel_job(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    uid, error = obs.submit_group([OBSERVATION], CONSTRAINTS)
+    [result] = serve(obs, [json.dumps({'id': 1, 'op': 'cancel', 'uids': [uid]})])
+    assert result == {'id': 1, 'op': 'cancel', 'ok': True, 'errors': {uid: []}}
+    assert obs.get_uids() == []
+
+
+def run_cli(settings, tmp_path, args, stdin=''):
+    path = tmp_path / 'settings.json'
+    path.write_text(json.dumps(settings))
+    return subprocess.run([sys.executable, '-m', 'ltrtml', '--settings', str(path)] + args,
+                          input=stdin, capture_output=True, text=True, cwd=ROOT, timeout=60)
+
+
+def test_daemon_reads_stdin(settings, node_agent, tmp_path):
+    jobs = ''.join(json.dumps({'id': n, 'observations': [OBSERVATION], 'constraints': CONSTRAINTS}) + '\n'
+                   for n in range(3))
+    process = run_cli(settings, tmp_path, ['daemon'], jobs + '{"id": "m", "op": "metrics"}\n')
+    assert process.returncode == 0, process.stderr
+    results = [json.loads(line) for line in process.stdout.splitlines()]
+    assert sorted(str(result['id']) for result in results) == ['0', '1', '2', 'm']
+    uids = sorted(result['uid'] for result in results if result['op'] == 'submit')
+    process = run_cli(settings, tmp_path, ['uids'])
+    assert sorted(process.stdout.split()) == uids
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='unix sockets only')
+def test_socket_path_must_be_a_socket(settings, tmp_path):
+    path = tmp_path / 'not_a_socket'
+    path.write_text('keep me')
+    process = run_cli(settings, tmp_path, ['daemon', '--socket', str(path)])
+    assert process.returncode == 2
+    assert 'is not a socket' in process.stderr
+    assert path.read_text() == 'keep me'
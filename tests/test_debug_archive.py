@@ -0,0 +1,83 @@
+import gzip
+import os
+import time
+
+import ltrtml
+
+REQUEST = '<RTML mode="request" uid="{0}"><Project/></RTML>'
+RESPONSE = '<RTML mode="confirm" uid="{0}"/>'
+
+
+def record(archive, uid, kind='submit'):
+    archive.record(kind, uid, REQUEST.format(uid), RESPONSE.format(uid))
+
+
+def test_find_by_uid_and_time(tmp_path):
+    archive = ltrtml.DebugArchive(str(tmp_path))
+    start = time.time()
+    record(archive, 'a')
+    record(archive, 'b')
+    record(archive, 'a', 'cancel')
+    archive.flush()
+    found = archive.find('a')
+    assert [item['kind'] for item in found] == ['submit', 'cancel']
+    assert found[0]['response'] == RESPONSE.format('a')
+    assert found[0]['request'].startswith('<RTML mode="request" uid="a">\n  <Project/>')
+    assert len(archive.find(start=start)) == 3
+    assert archive.find(end=start - 1) == []
+    archive.close()
+    assert len(archive.find()) == 3
+
+
+def test_old_segments_are_pruned(tmp_path):
+    archive = ltrtml.DebugArchive(str(tmp_path), segment_bytes=1, max_segments=2)
+    for number in range(5):
+        record(archive, str(number))
+        archive.flush()
+    archive.close()
+    assert len(archive.segments()) == 2
+    assert [item['uid'] for item in archive.find()] == ['3', '4']
+
+
+def test_archives_sharing_a_directory(tmp_path):
+    first = ltrtml.DebugArchive(str(tmp_path), segment_bytes=1, max_segments=1)
+    second = ltrtml.DebugArchive(str(tmp_path), max_segments=1)
+    record(second, 'second')
+    second.flush()
+    for number in range(3):
+        record(first, str(number))
+        first.flush()
+    # The segment second is still writing to is not pruned by first
+    assert len(second.find('second')) == 1
+    record(second, 'second')
+    second.flush()
+    assert len(second.find('second')) == 2
+    assert len(set(first.segments())) == len(first.segments())
+    first.close()
+    second.close()
+
+
+def test_damaged_segment(tmp_path):
+    archive = ltrtml.DebugArchive(str(tmp_path))
+    record(archive, 'a')
+    record(archive, 'b')
+    archive.close()
+    path = os.path.join(str(tmp_path), archive.segments()[0])
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2] + b'\0' * 64)
+    archive.find()
+    with open(path, 'wb') as f:
+        f.write(b'not gzip')
+    assert archive.find() == []
+
+
+def test_segments_are_gzip_json_lines(tmp_path):
+    archive = ltrtml.DebugArchive(str(tmp_path), pretty_print=False)
+    record(archive, 'a')
+    archive.close()
+    with gzip.open(os.path.join(str(tmp_path), archive.segments()[0]), 'rt') as f:
+        lines = f.readlines()
+    assert len(lines) == 1
+    assert '"request": "<RTML mode=\\"request\\" uid=\\"a\\"><Project/></RTML>"' in lines[0]
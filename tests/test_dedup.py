@@ -0,0 +1,65 @@
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION
+
+
+def submit(obs, force=False):
+    return obs.submit_group([OBSERVATION], CONSTRAINTS, force)
+
+
+def test_identical_group_is_not_sent_again(settings, node_agent):
+    obs = ltrtml.LTObs(dict(settings, DEDUP=True))
+    uid, error = submit(obs)
+    assert submit(obs) == (uid, '')
+    assert node_agent.counts['request'] == 1
+    assert submit(obs, force=True)[0] != uid
+    assert node_agent.counts['request'] == 2
+
+
+def test_dedup_is_off_by_default(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    uid, error = submit(obs)
+    assert submit(obs)[0] != uid
+    assert node_agent.counts['request'] == 2
+    # Nothing is hashed when the hash is not needed
+    assert obs.ledger.get(uid)[2] is None
+
+
+def test_identical_groups_sent_together_are_sent_once(settings, node_agent):
+    node_agent.latency = 0.1
+    obs = ltrtml.LTObs(dict(settings, DEDUP=True))
+    results = obs.submit_groups([([OBSERVATION], CONSTRAINTS)] * 4, max_workers=4)
+    assert node_agent.counts['request'] == 1
+    assert sum(result[1] == '' for result in results) == 1
+    assert all('still being sent' in result[1] for result in results if result[1] != '')
+
+
+def test_rejected_group_can_be_sent_again(settings, node_agent):
+    node_agent.reject_rate = 1.0
+    obs = ltrtml.LTObs(dict(settings, DEDUP=True))
+    assert submit(obs)[0] == 'fail'
+    node_agent.reject_rate = 0.0
+    assert submit(obs)[1] == ''
+    assert node_agent.counts['request'] == 2
+
+
+def test_group_with_lost_reply_is_not_sent_again(settings, node_agent):
+    node_agent.latency = 0.5
+    obs = ltrtml.LTObs(dict(settings, DEDUP=True, TIMEOUT=0.2))
+    result = submit(obs)
+    assert 'may have been accepted' in result[1]
+    node_agent.latency = 0.0
+    result = submit(obs)
+    assert result[0] == 'fail'
+    assert 'force=True' in result[1]
+    assert node_agent.counts['request'] == 1
+    assert obs.get_uids() == []
+    uid, error = submit(obs, force=True)
+    assert error == ''
+    assert obs.get_uids() == [uid]
+
+
+def test_hash_ignores_uid_and_pretty_printing(settings):
+    compact = ltrtml.LTObs(settings).build_group([OBSERVATION], CONSTRAINTS)
+    pretty = ltrtml.LTObs(dict(settings, PRETTY_PRINT=True)).build_group([OBSERVATION], CONSTRAINTS)
+    assert compact != pretty
+    assert ltrtml.payload_hash(compact) == ltrtml.payload_hash(pretty)
@@ -0,0 +1,59 @@
+import os
+import pickle
+import threading
+
+import ltrtml
+
+
+def test_add_remove_and_order(tmp_path):
+    ledger = ltrtml.LTLedger(str(tmp_path / 'uids'))
+    for uid in ('c', 'a', 'b'):
+        ledger.add(uid)
+    assert ledger.uids() == ['c', 'a', 'b']
+    ledger.remove(['a', 'missing'])
+    assert ledger.uids() == ['c', 'b']
+    uid, submitted, digest, status = ledger.get('c')
+    assert (uid, digest, status) == ('c', None, 'confirm')
+    assert submitted > 0
+    assert ledger.get('a') is None
+
+
+def test_store_is_shared(tmp_path):
+    first = ltrtml.LTLedger(str(tmp_path / 'uids'))
+    second = ltrtml.LTLedger(str(tmp_path / 'uids'))
+    first.add('a')
+    second.add('b')
+    assert first.uids() == second.uids() == ['a', 'b']
+
+
+def test_concurrent_adds(tmp_path):
+    ledger = ltrtml.LTLedger(str(tmp_path / 'uids'))
+
+    def add(worker):
+        for n in range(50):
+            ledger.add('{0}_{1}'.format(worker, n))
+
+    threads = [threading.Thread(target=add, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(ledger.uids()) == 200
+
+
+def test_pickle_is_migrated_once(tmp_path):
+    path = str(tmp_path / 'uids')
+    with open(path + '.pkl', 'wb') as f:
+        pickle.dump(['old_1', 'old_2'], f)
+    ledger = ltrtml.LTLedger(path)
+    assert ledger.uids() == ['old_1', 'old_2']
+    assert not os.path.exists(path + '.pkl')
+    assert os.path.exists(path + '.pkl.migrated')
+    ledger.add('new')
+    assert ltrtml.LTLedger(path).uids() == ['old_1', 'old_2', 'new']
+
+
+def test_obs_uses_pklfile_store(settings):
+    ledger = ltrtml.LTLedger(settings['PKLFILE'])
+    ledger.add('earlier')
+    assert ltrtml.LTObs(settings).get_uids() == ['earlier']
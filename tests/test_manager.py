@@ -0,0 +1,82 @@
+import pickle
+from concurrent.futures import wait
+
+import ltrtml
+import mock_node_agent
+from conftest import CONSTRAINTS, OBSERVATION
+
+
+def proposal(settings, name, pklfile):
+    return dict(settings, proposal=name, username=name, PKLFILE=pklfile)
+
+
+def test_proposal_uids_are_moved_into_the_store(settings, tmp_path):
+    old = ltrtml.LTLedger(str(tmp_path / 'old'))
+    old.add('a')
+    old.add('b')
+    with open(str(tmp_path / 'older.pkl'), 'wb') as f:
+        pickle.dump(['c'], f)
+    shared = ltrtml.LTLedger(str(tmp_path / 'shared'))
+    shared.add('d')
+    proposals = [proposal(settings, 'P1', str(tmp_path / 'old')),
+                 proposal(settings, 'P2', str(tmp_path / 'older')),
+                 proposal(settings, 'P3', str(tmp_path / 'shared')),
+                 proposal(settings, 'P4', str(tmp_path / 'missing'))]
+
+    manager = ltrtml.LTManager(proposals, str(tmp_path / 'shared'))
+    assert manager['P1'].get_uids() == ['a', 'b']
+    assert manager['P2'].get_uids() == ['c']
+    assert manager['P3'].get_uids() == ['d']
+    assert manager['P4'].get_uids() == []
+    manager.close()
+    assert old.uids() == []
+    assert not (tmp_path / 'missing.db').exists()
+
+    manager = ltrtml.LTManager(proposals, str(tmp_path / 'shared'))
+    assert manager['P1'].get_uids() == ['a', 'b']
+    assert manager['P2'].get_uids() == ['c']
+    manager.close()
+
+
+def test_a_burst_does_not_hold_up_other_proposals(settings, node_agent, tmp_path):
+    node_agent.latency = 0.02
+    proposals = [proposal(settings, name, None) for name in ('PA', 'PB')]
+    manager = ltrtml.LTManager(proposals, str(tmp_path / 'shared'), max_workers=2)
+    burst = [manager.submit('PA', [OBSERVATION], CONSTRAINTS) for _ in range(30)]
+    others = [manager.submit('PB', [OBSERVATION], CONSTRAINTS) for _ in range(3)]
+    assert manager.pending()['PA'] > 20
+    wait(others)
+    assert sum(future.done() for future in burst) < 15
+    wait(burst)
+    manager.close()
+    assert all(future.result()[1] == '' for future in burst + others)
+    assert len(manager['PA'].get_uids()) == 30
+    assert len(manager['PB'].get_uids()) == 3
+
+
+def test_proposals_are_kept_apart(settings, node_agent, tmp_path, monkeypatch):
+    usernames = []
+    do_post = mock_node_agent.NodeAgentHandler.do_POST
+
+    def record(handler):
+        usernames.append(handler.headers['Username'])
+        return do_post(handler)
+
+    monkeypatch.setattr(mock_node_agent.NodeAgentHandler, 'do_POST', record)
+    proposals = [proposal(settings, name, None) for name in ('PA', 'PB')]
+    manager = ltrtml.LTManager(proposals, str(tmp_path / 'shared'))
+    assert len(manager.sessions) == 1
+    results = manager.submit_groups([('PA', [OBSERVATION], CONSTRAINTS),
+                                     ('PB', [OBSERVATION], CONSTRAINTS),
+                                     ('PA', [OBSERVATION], CONSTRAINTS)])
+    assert [error for uid, error in results] == ['', '', '']
+    assert sorted(manager['PA'].get_uids()) == sorted([results[0][0], results[2][0]])
+    assert manager['PB'].get_uids() == [results[1][0]]
+    assert sorted(usernames) == ['PA', 'PA', 'PB']
+
+    assert manager.cancel('PB', results[1][0]).result() == []
+    assert manager['PB'].get_uids() == []
+    assert len(manager['PA'].get_uids()) == 2
+    assert ltrtml.LTLedger(str(tmp_path / 'shared')).uids() == []
+    manager.close()
+    assert node_agent.counts['wsdl'] == 1
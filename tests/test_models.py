@@ -0,0 +1,116 @@
+import datetime
+
+import pytest
+
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION, TARGET
+
+
+def test_target_sexagesimal_and_decimal():
+    target = ltrtml.Target.parse('Vega', '18:36:56.336', '+38:47:01.280')
+    assert (target.ra_h, target.ra_m, target.ra_s) == (18, 36, 56.336)
+    assert (target.dec_sign, target.dec_d, target.dec_m, target.dec_s) == ('+', 38, 47, 1.28)
+    assert ltrtml.Target.parse('a', 150, -5.5) == ltrtml.Target.parse('a', '150', '-5.5') \
+        == ltrtml.Target.parse('a', '10:00:00', '-05:30:00')
+    assert ltrtml.Target.parse('a', 0, -0.0).dec_sign == '+'
+    assert ltrtml.Target.from_dict(TARGET) == target
+
+
+@pytest.mark.parametrize('ra, dec', [
+    ('10:00:00', '--10:00:00'),
+    ('10:00:00', '+-10:00:00'),
+    ('10:00:00', '+10:-5:00'),
+    ('10:00:00', '10:00:00'),
+    ('24:00:00', '+00:00:00'),
+    ('10:60:00', '+00:00:00'),
+    ('10:00:00', '+91:00:00'),
+    ('10:00:00', '+90:00:01'),
+    ('10:00', '+10:00:00'),
+    (360, 0),
+    (0, 90.5),
+    ('ten', '+10:00:00'),
+])
+def test_bad_targets(ra, dec):
+    with pytest.raises(ValueError):
+        ltrtml.Target.parse('t', ra, dec)
+
+
+def test_target_needs_a_name():
+    with pytest.raises(ValueError, match='needs a name'):
+        ltrtml.Target.parse('', '10:00:00', '+10:00:00')
+
+
+def test_constraints_from_dict():
+    constraints = ltrtml.Constraints.from_dict(CONSTRAINTS)
+    assert constraints.air_mass == 2.0
+    assert constraints.photometric is True
+    assert constraints.start == datetime.datetime(2020, 2, 18, 18)
+    assert constraints.end == datetime.datetime(2020, 2, 28)
+
+
+@pytest.mark.parametrize('key, value, message', [
+    ('seeing', '', 'No value for seeing'),
+    ('photometric', 'maybe', 'yes or no'),
+    ('seeing', '-1', 'greater than zero'),
+    ('air_mass', 'high', 'must be a number'),
+    ('start_date', '18/02/2020', 'YYYY-MM-DD'),
+    ('end_date', '2020-02-17', 'end must be after start'),
+])
+def test_bad_constraints(key, value, message):
+    with pytest.raises(ValueError, match=message):
+        ltrtml.Constraints.from_dict(dict(CONSTRAINTS, **{key: value}))
+
+
+def test_observations_from_dict():
+    ioi = ltrtml.observation_from_dict(OBSERVATION)
+    assert ioi == ltrtml.IOI(ltrtml.Target.from_dict(TARGET), 120.0, 5)
+    ioo = ltrtml.observation_from_dict({'instrument': 'IO:O', 'target': TARGET, 'binning': '2',
+                                        'filters': {'R': {'exp_time': '10', 'exp_count': '3'}}})
+    assert ioo.filters == (('R', 10.0, 3),)
+    assert ioo.binning == 2
+    moptop = ltrtml.observation_from_dict({'instrument': 'Moptop', 'target': TARGET,
+                                           'filters': {'L': {'exp_time': '30', 'rot_speed': 'slow'}}})
+    assert moptop.filters == (('L', 30.0, 'slow'),)
+
+
+@pytest.mark.parametrize('observation, message', [
+    (dict(OBSERVATION, instrument='Hubble'), 'Hubble not supported'),
+    (dict(OBSERVATION, exp_count='0'), 'exp_count must be greater than zero'),
+    ({'instrument': 'IO:O', 'target': TARGET, 'binning': '1',
+      'filters': {'Y': {'exp_time': '10', 'exp_count': '1'}}}, 'Filter Y not available for IO:O'),
+    ({'instrument': 'Sprat', 'target': TARGET, 'exp_time': '10', 'exp_count': '1', 'grating': 'green'},
+     'grating'),
+    ({'instrument': 'Frodo', 'target': TARGET,
+      'exp_time_Blue': '10', 'exp_count_Blue': '1', 'res_Blue': 'high',
+      'exp_time_Red': '10', 'exp_count_Red': '1', 'res_Red': 'medium'}, 'res_red'),
+    ({'instrument': 'Moptop', 'target': TARGET,
+      'filters': {'R': {'exp_time': '10', 'rot_speed': 'medium'}}}, 'rot_speed'),
+])
+def test_bad_observations(observation, message):
+    with pytest.raises(ValueError, match=message):
+        ltrtml.observation_from_dict(observation)
+
+
+def test_models_are_hashable():
+    target = ltrtml.Target.from_dict(TARGET)
+    observations = {ltrtml.IOI(target, 120, 5), ltrtml.IOI(target, '120.0', '5'),
+                    ltrtml.Sprat(target, 60, 1, 'red')}
+    assert len(observations) == 2
+    assert len({target, ltrtml.Target.parse('Vega', '18:36:56.336', '+38:47:01.28')}) == 1
+    with pytest.raises(AttributeError):
+        target.name = 'Altair'
+
+
+def test_models_and_dicts_build_the_same_group(settings):
+    obs = ltrtml.LTObs(settings)
+    from_dicts = obs.build_group([OBSERVATION], CONSTRAINTS)
+    from_models = obs.build_group([ltrtml.observation_from_dict(OBSERVATION)],
+                                  ltrtml.Constraints.from_dict(CONSTRAINTS))
+    assert ltrtml.payload_hash(from_dicts) == ltrtml.payload_hash(from_models)
+
+
+def test_submit_group_reports_bad_values(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    result = obs.submit_group([dict(OBSERVATION, exp_time='')], CONSTRAINTS)
+    assert result[0] == 'fail'
+    assert 'request' not in node_agent.counts
@@ -0,0 +1,56 @@
+import pytest
+from lxml import etree
+
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION
+
+REPLY = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+         '<RTML xmlns="http://www.rtml.org/v3.1a" mode="{0}" uid="test_1" version="3.1a">{1}</RTML>')
+
+
+def test_confirm():
+    response = ltrtml.decode_response(REPLY.format('confirm', ''))
+    assert response == ltrtml.RTMLResponse('confirm', 'test_1', (), ())
+
+
+def test_reject_with_errors_and_scores():
+    body = ('<Error> No such filter </Error><Error/>'
+            '<Score>0.75</Score><Score>n/a</Score>')
+    response = ltrtml.decode_response(REPLY.format('reject', body))
+    assert response.mode == 'reject'
+    assert response.uid == 'test_1'
+    assert response.errors == ('No such filter', '')
+    assert response.scores == (0.75, None)
+
+
+def test_str_and_bytes_give_the_same_response():
+    text = REPLY.format('reject', '<Error>Zenith distance é</Error>')
+    from_str = ltrtml.decode_response(text)
+    assert from_str == ltrtml.decode_response(text.encode('ISO-8859-1'))
+    assert from_str.errors == ('Zenith distance é',)
+
+
+def test_parser_recovers_after_bad_reply():
+    with pytest.raises(etree.XMLSyntaxError):
+        ltrtml.decode_response('<RTML mode="confirm"')
+    assert ltrtml.decode_response(REPLY.format('confirm', '')).mode == 'confirm'
+
+
+def test_rejected_submit_and_cancel(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    uid, error = obs.submit_group([OBSERVATION], CONSTRAINTS)
+    assert error == ''
+    node_agent.reject_rate = 1.0
+    node_agent.reject_body = '<Error>Bad seeing</Error><Error>Too late</Error>'
+
+    result = obs.submit_group([OBSERVATION], CONSTRAINTS)
+    assert isinstance(result, ltrtml.LTRejection)
+    assert result == ['fail', 'This submission has been rejected: Bad seeing; Too late']
+    assert result.response.mode == 'reject'
+    assert result.response.errors == ('Bad seeing', 'Too late')
+
+    errors = obs.cancel_group(uid)
+    assert isinstance(errors, ltrtml.LTRejection)
+    assert errors == ['Cancel Failed for ' + uid + ': Bad seeing; Too late']
+    assert errors.response.uid == uid
+    assert obs.get_uids() == [uid]
@@ -0,0 +1,68 @@
+from lxml import etree
+
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION, TARGET
+
+OBSERVATIONS = [
+    OBSERVATION,
+    {'instrument': 'IO:O', 'target': TARGET, 'binning': '2',
+     'filters': {'R': {'exp_time': '10', 'exp_count': '3'}, 'G': {'exp_time': '20.5', 'exp_count': '1'}}},
+    {'instrument': 'Sprat', 'target': TARGET, 'exp_time': '60', 'exp_count': '2', 'grating': 'red'},
+    {'instrument': 'Frodo', 'target': {'name': 'Altair', 'RA': '297.69583', 'DEC': '8.86833'},
+     'exp_time_Blue': '30', 'exp_count_Blue': '1', 'res_Blue': 'high',
+     'exp_time_Red': '40', 'exp_count_Red': '2', 'res_Red': 'low'},
+    {'instrument': 'Moptop', 'target': TARGET, 'filters': {'L': {'exp_time': '30', 'rot_speed': 'slow'}}},
+]
+
+
+def canonical(payload):
+    root = etree.fromstring(payload, etree.XMLParser(remove_blank_text=True))
+    return etree.tostring(root, method='c14n')
+
+
+def build(settings, pretty_print):
+    obs = ltrtml.LTObs(settings, uid_generator=lambda: 'test_uid')
+    return obs.build_group(OBSERVATIONS, CONSTRAINTS, pretty_print=pretty_print)
+
+
+def test_streamed_and_pretty_payloads_match(settings):
+    streamed = build(settings, False)
+    pretty = build(settings, True)
+    assert isinstance(streamed, bytes) and isinstance(pretty, bytes)
+    assert streamed != pretty
+    assert canonical(streamed) == canonical(pretty)
+    assert b'\n' not in streamed
+    root = etree.fromstring(streamed)
+    assert root.get('uid') == 'test_uid'
+    assert len(root.findall('{*}Schedule')) == 7
+
+
+def test_settings_choose_the_default(settings):
+    assert ltrtml.LTObs(settings).pretty_print is False
+    obs = ltrtml.LTObs(dict(settings, PRETTY_PRINT=True), uid_generator=lambda: 'test_uid')
+    assert obs.build_group(OBSERVATIONS, CONSTRAINTS) == build(settings, True)
+
+
+def test_both_forms_are_accepted(settings, node_agent):
+    for pretty_print in (False, True):
+        obs = ltrtml.LTObs(dict(settings, PRETTY_PRINT=pretty_print))
+        uid, error = obs.submit_group(OBSERVATIONS, CONSTRAINTS)
+        assert error == ''
+    assert node_agent.counts['request'] == 2
+
+
+def phases(settings, pretty_print):
+    seen = []
+    obs = ltrtml.LTObs(settings)
+    obs.add_hook(lambda phase, seconds: seen.append((phase, seconds)))
+    obs.build_group(OBSERVATIONS, CONSTRAINTS, pretty_print=pretty_print)
+    return seen
+
+
+def test_serialize_is_timed_in_both_modes(settings):
+    for pretty_print in (False, True):
+        seen = phases(settings, pretty_print)
+        assert [phase for phase, seconds in seen] == ['submit.build', 'submit.serialize']
+        assert all(seconds >= 0 for phase, seconds in seen)
+    build_seconds, serialize_seconds = [seconds for phase, seconds in phases(settings, False)]
+    assert serialize_seconds <= build_seconds
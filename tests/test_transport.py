@@ -0,0 +1,118 @@
+import socket
+import time
+
+import pytest
+
+import ltrtml
+from conftest import CONSTRAINTS, OBSERVATION
+
+
+def submit(obs):
+    return obs.submit_group([OBSERVATION], CONSTRAINTS)
+
+
+def test_policy_from_settings():
+    policy = ltrtml.TransportPolicy.from_settings({'TIMEOUT': 5, 'RETRIES': 0, 'BREAKER_RESET': 1})
+    assert (policy.timeout, policy.retries, policy.breaker_reset) == (5, 0, 1)
+    assert policy.backoff == 0.5
+
+
+def test_delay_is_capped():
+    policy = ltrtml.TransportPolicy(backoff=1, max_backoff=3)
+    assert all(0 <= policy.delay(attempt) <= 3 for attempt in range(10))
+
+
+def test_submit_is_confirmed(settings, node_agent):
+    obs = ltrtml.LTObs(settings)
+    uid, error = submit(obs)
+    assert error == ''
+    assert obs.get_uids() == [uid]
+    assert node_agent.counts['request'] == 1
+
+
+def test_unreachable_node_agent_is_retried(settings):
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    obs = ltrtml.LTObs(dict(settings, LT_PORT=str(port)))
+    metrics = ltrtml.LTMetrics()
+    obs.add_hook(metrics)
+    result = submit(obs)
+    assert result[0] == 'fail'
+    assert 'may have been accepted' not in result[1]
+    assert metrics.summary()['retry']['count'] == 2
+
+
+def test_503_is_retried(settings, node_agent):
+    node_agent.failures += [503, 503]
+    obs = ltrtml.LTObs(settings)
+    uid, error = submit(obs)
+    assert error == ''
+    assert node_agent.counts[503] == 2
+    assert node_agent.counts['request'] == 1
+
+
+def test_submit_is_not_resent_after_a_lost_reply(settings, node_agent):
+    node_agent.latency = 0.5
+    obs = ltrtml.LTObs(dict(settings, TIMEOUT=0.2))
+    result = submit(obs)
+    assert result[0] == 'fail'
+    assert 'may have been accepted' in result[1]
+    assert node_agent.counts['request'] == 1
+    assert obs.get_uids() == []
+
+
+def test_cancel_is_retried_after_a_lost_reply(settings, node_agent):
+    node_agent.failures += [504]
+    obs = ltrtml.LTObs(settings)
+    assert obs.cancel_group('test_1') == []
+    assert node_agent.counts[504] == 1
+    assert node_agent.counts['abort'] == 1
+
+
+def test_breaker_opens_and_recovers(settings, node_agent):
+    node_agent.failures += [503, 503]
+    obs = ltrtml.LTObs(dict(settings, RETRIES=0, BREAKER_THRESHOLD=2, BREAKER_RESET=0.2))
+    assert submit(obs)[0] == 'fail'
+    assert submit(obs)[0] == 'fail'
+    result = submit(obs)
+    assert result[0] == 'fail'
+    assert 'unavailable' in result[1]
+    assert node_agent.counts[503] == 2
+    assert 'request' not in node_agent.counts
+
+    time.sleep(0.25)
+    assert submit(obs)[1] == ''
+    assert submit(obs)[1] == ''
+    assert node_agent.counts['request'] == 2
+
+
+def test_breaker_trial_failure_reopens(settings, node_agent):
+    node_agent.failures += [503, 503]
+    obs = ltrtml.LTObs(dict(settings, RETRIES=0, BREAKER_THRESHOLD=1, BREAKER_RESET=0.2))
+    assert submit(obs)[0] == 'fail'
+    time.sleep(0.25)
+    assert submit(obs)[0] == 'fail'
+    with pytest.raises(ltrtml.CircuitOpenError):
+        obs.session.breaker.before()
+
+
+def test_breaker_counts_calls_not_attempts(settings, node_agent):
+    node_agent.failures += [503] * 3
+    obs = ltrtml.LTObs(dict(settings, BREAKER_THRESHOLD=2))
+    assert submit(obs)[0] == 'fail'
+    assert node_agent.counts[503] == 3
+    assert obs.session.breaker.failures == 1
+    assert submit(obs)[1] == ''
+
+
+def test_breaker_trial_released_after_other_errors(settings, node_agent):
+    node_agent.failures += [503, 400]
+    obs = ltrtml.LTObs(dict(settings, RETRIES=0, BREAKER_THRESHOLD=1, BREAKER_RESET=0.2))
+    assert submit(obs)[0] == 'fail'
+    time.sleep(0.25)
+    # Not a connection failure, so the trial neither closes nor reopens the breaker
+    assert submit(obs) == ['fail', "Error with connection to telescope: (400, 'Bad Request')"]
+    assert node_agent.counts[400] == 1
+    # The trial ended without an answer, so the next call is let through
+    assert submit(obs)[1] == ''
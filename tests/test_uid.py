@@ -0,0 +1,43 @@
+import threading
+
+import ltrtml
+
+
+def test_uid_format():
+    uid = ltrtml.UIDGenerator('format', worker='w1')()
+    prefix, second, worker, count = uid.split('_')
+    assert (prefix, worker, count) == ('format', 'w1', '0')
+    assert int(second) > 0
+
+
+def test_generators_share_a_counter():
+    first = ltrtml.UIDGenerator('shared')
+    second = ltrtml.UIDGenerator('shared')
+    uids = [generator() for _ in range(50) for generator in (first, second)]
+    assert len(set(uids)) == len(uids)
+
+
+def test_unique_between_threads():
+    generators = [ltrtml.UIDGenerator('threads') for _ in range(4)]
+    uids = []
+
+    def make(generator):
+        made = [generator() for _ in range(500)]
+        uids.extend(made)
+
+    threads = [threading.Thread(target=make, args=(generator,)) for generator in generators]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(uids) == 2000
+    assert len(set(uids)) == 2000
+
+
+def test_unique_when_the_clock_goes_back(monkeypatch):
+    times = iter([1000.5, 1000.9, 999.2, 999.8, 1000.1, 1001.0])
+    monkeypatch.setattr(ltrtml.time, 'time', lambda: next(times))
+    generator = ltrtml.UIDGenerator('clock', worker='w')
+    uids = [generator() for _ in range(6)]
+    assert uids == ['clock_1000_w_0', 'clock_1000_w_1', 'clock_1000_w_2',
+                    'clock_1000_w_3', 'clock_1000_w_4', 'clock_1001_w_0']
@@ -0,0 +1,46 @@
+import pytest
+
+import ltrtml
+from conftest import CONSTRAINTS, TARGET
+
+OBSERVATIONS = [
+    {'instrument': 'IO:O', 'target': TARGET, 'binning': '2',
+     'filters': {f: {'exp_time': '60', 'exp_count': '3'} for f in ltrtml.IOO_FILTERS}},
+    {'instrument': 'IO:I', 'target': TARGET, 'exp_time': '120.0', 'exp_count': '5'},
+    {'instrument': 'Sprat', 'target': TARGET, 'exp_time': '120.0', 'exp_count': '3', 'grating': 'blue'},
+    {'instrument': 'Frodo', 'target': TARGET,
+     'exp_time_Blue': '120.0', 'exp_count_Blue': '3', 'res_Blue': 'high',
+     'exp_time_Red': '120.0', 'exp_count_Red': '3', 'res_Red': 'low'},
+    {'instrument': 'Moptop', 'target': TARGET,
+     'filters': {f: {'exp_time': '60', 'rot_speed': 'slow'} for f in ltrtml.MOPTOP_FILTERS}},
+]
+
+
+@pytest.fixture(scope='module')
+def validator():
+    return ltrtml.RTMLValidator()
+
+
+@pytest.mark.parametrize('observation', OBSERVATIONS, ids=lambda observation: observation['instrument'])
+def test_groups_are_valid(settings, validator, observation):
+    payload = ltrtml.LTObs(settings).build_group([observation], CONSTRAINTS)
+    assert validator.validate(payload) == []
+
+
+@pytest.mark.parametrize('observation, constraints, element', [
+    (OBSERVATIONS[1], dict(CONSTRAINTS, air_mass='3.5'), 'AirmassConstraint'),
+    (dict(OBSERVATIONS[0], binning='3'), CONSTRAINTS, 'X'),
+])
+def test_limits_not_checked_by_the_models(settings, validator, observation, constraints, element):
+    payload = ltrtml.LTObs(settings).build_group([observation], constraints)
+    errors = validator.validate(payload)
+    assert errors
+    assert element in errors[0]
+
+
+def test_invalid_group_is_not_sent(settings, node_agent):
+    obs = ltrtml.LTObs(dict(settings, VALIDATE=True))
+    result = obs.submit_group([OBSERVATIONS[1]], dict(CONSTRAINTS, air_mass='3.5'))
+    assert result[0] == 'fail'
+    assert result[1].startswith('Payload failed schema validation')
+    assert 'request' not in node_agent.counts